@@ -0,0 +1,48 @@
+"""Notify on user changes
+
+Revision ID: 9c41d2e7a8b3
+Revises: 45caad34987d
+Create Date: 2026-10-18 10:12:41.503217
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c41d2e7a8b3'
+down_revision: Union[str, Sequence[str], None] = '45caad34987d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Lets every app worker drop its cached copy of a user as soon as the row changes
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_user_changed() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                PERFORM pg_notify('user_changed', OLD.username);
+            ELSE
+                PERFORM pg_notify('user_changed', NEW.username);
+                IF TG_OP = 'UPDATE' AND NEW.username <> OLD.username THEN
+                    PERFORM pg_notify('user_changed', OLD.username);
+                END IF;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER user_changed
+        AFTER INSERT OR UPDATE OR DELETE ON "user"
+        FOR EACH ROW EXECUTE FUNCTION notify_user_changed()
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('DROP TRIGGER IF EXISTS user_changed ON "user"')
+    op.execute("DROP FUNCTION IF EXISTS notify_user_changed()")
@@ -0,0 +1,49 @@
+"""Add cognito outbox
+
+Revision ID: a9d46e0b7c15
+Revises: f3c81a6d2e94
+Create Date: 2026-10-18 17:20:46.102384
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+import sqlmodel
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9d46e0b7c15'
+down_revision: Union[str, Sequence[str], None] = 'f3c81a6d2e94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'cognitooutbox',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('operation', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('username', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('payload', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column('status', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('last_error', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'ix_cognitooutbox_pending', 'cognitooutbox', ['next_attempt_at'], unique=False,
+        postgresql_where=sa.text("status = 'pending'"),
+    )
+    # Fails if the table already holds duplicate usernames, which have to be resolved by hand
+    op.create_index('ix_user_username', 'user', ['username'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_user_username', table_name='user')
+    op.drop_index('ix_cognitooutbox_pending', table_name='cognitooutbox', postgresql_where=sa.text("status = 'pending'"))
+    op.drop_table('cognitooutbox')
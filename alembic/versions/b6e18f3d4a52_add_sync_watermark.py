@@ -0,0 +1,35 @@
+"""Add sync watermark
+
+Revision ID: b6e18f3d4a52
+Revises: a9d46e0b7c15
+Create Date: 2026-10-18 18:41:09.527310
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+import sqlmodel
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b6e18f3d4a52'
+down_revision: Union[str, Sequence[str], None] = 'a9d46e0b7c15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'syncwatermark',
+        sa.Column('name', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('last_modified', sa.DateTime(), nullable=True),
+        sa.Column('synced_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('syncwatermark')
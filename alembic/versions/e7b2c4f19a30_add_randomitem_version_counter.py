@@ -0,0 +1,77 @@
+"""Add randomitem version counter
+
+Revision ID: e7b2c4f19a30
+Revises: d5a8f3b61c07
+Create Date: 2026-10-18 16:05:33.918204
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7b2c4f19a30'
+down_revision: Union[str, Sequence[str], None] = 'd5a8f3b61c07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'randomitemversion',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('user_id')
+    )
+    # Statement level triggers bump each affected user's counter once per statement,
+    # so a batch insert of 1000 items costs one upsert rather than 1000
+    op.execute("""
+        CREATE OR REPLACE FUNCTION bump_randomitem_version() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO randomitemversion (user_id, version)
+                SELECT DISTINCT user_id, 1 FROM new_rows WHERE user_id IS NOT NULL
+                ON CONFLICT (user_id) DO UPDATE SET version = randomitemversion.version + 1;
+            ELSIF TG_OP = 'UPDATE' THEN
+                INSERT INTO randomitemversion (user_id, version)
+                SELECT user_id, 1 FROM (
+                    SELECT user_id FROM new_rows UNION SELECT user_id FROM old_rows
+                ) AS changed WHERE user_id IS NOT NULL
+                ON CONFLICT (user_id) DO UPDATE SET version = randomitemversion.version + 1;
+            ELSE
+                INSERT INTO randomitemversion (user_id, version)
+                SELECT DISTINCT user_id, 1 FROM old_rows WHERE user_id IS NOT NULL
+                ON CONFLICT (user_id) DO UPDATE SET version = randomitemversion.version + 1;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER randomitem_version_insert
+        AFTER INSERT ON randomitem REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_randomitem_version()
+    """)
+    op.execute("""
+        CREATE TRIGGER randomitem_version_update
+        AFTER UPDATE ON randomitem REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_randomitem_version()
+    """)
+    op.execute("""
+        CREATE TRIGGER randomitem_version_delete
+        AFTER DELETE ON randomitem REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_randomitem_version()
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS randomitem_version_delete ON randomitem")
+    op.execute("DROP TRIGGER IF EXISTS randomitem_version_update ON randomitem")
+    op.execute("DROP TRIGGER IF EXISTS randomitem_version_insert ON randomitem")
+    op.execute("DROP FUNCTION IF EXISTS bump_randomitem_version()")
+    op.drop_table('randomitemversion')
@@ -0,0 +1,104 @@
+"""Add randomitem summary table
+
+Revision ID: f3c81a6d2e94
+Revises: e7b2c4f19a30
+Create Date: 2026-10-18 16:41:09.527731
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3c81a6d2e94'
+down_revision: Union[str, Sequence[str], None] = 'e7b2c4f19a30'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'randomitemsummary',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('count', sa.BigInteger(), nullable=False),
+        sa.Column('sum_num', sa.BigInteger(), nullable=False),
+        sa.Column('min_num', sa.Integer(), nullable=True),
+        sa.Column('max_num', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('user_id')
+    )
+    # Lets the summary trigger find a user's new min/max without scanning their items
+    op.create_index('ix_randomitem_user_id_num', 'randomitem', ['user_id', 'num'], unique=False)
+    op.execute("""
+        INSERT INTO randomitemsummary (user_id, count, sum_num, min_num, max_num)
+        SELECT user_id, count(*), sum(num), min(num), max(num)
+        FROM randomitem WHERE user_id IS NOT NULL GROUP BY user_id
+    """)
+    # Runs in the transaction of the statement changing randomitem, so the summary is never
+    # out of step with the items. Removed rows are subtracted first; min/max can't be
+    # subtracted, so when a removed value was an extreme it is looked up again on the
+    # (user_id, num) index, which already reflects the rows added by the statement
+    op.execute("""
+        CREATE OR REPLACE FUNCTION update_randomitem_summary() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE randomitemsummary AS s SET
+                    count = s.count - removed.n,
+                    sum_num = s.sum_num - removed.total,
+                    min_num = CASE WHEN removed.lo <= s.min_num THEN NULL ELSE s.min_num END,
+                    max_num = CASE WHEN removed.hi >= s.max_num THEN NULL ELSE s.max_num END
+                FROM (
+                    SELECT user_id, count(*) AS n, sum(num) AS total, min(num) AS lo, max(num) AS hi
+                    FROM old_rows WHERE user_id IS NOT NULL GROUP BY user_id
+                ) AS removed
+                WHERE s.user_id = removed.user_id;
+
+                UPDATE randomitemsummary AS s SET
+                    min_num = (SELECT min(num) FROM randomitem WHERE user_id = s.user_id),
+                    max_num = (SELECT max(num) FROM randomitem WHERE user_id = s.user_id)
+                WHERE s.user_id IN (SELECT user_id FROM old_rows)
+                    AND (s.min_num IS NULL OR s.max_num IS NULL);
+            END IF;
+
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO randomitemsummary AS s (user_id, count, sum_num, min_num, max_num)
+                SELECT user_id, count(*), sum(num), min(num), max(num)
+                FROM new_rows WHERE user_id IS NOT NULL GROUP BY user_id
+                ON CONFLICT (user_id) DO UPDATE SET
+                    count = s.count + EXCLUDED.count,
+                    sum_num = s.sum_num + EXCLUDED.sum_num,
+                    min_num = LEAST(s.min_num, EXCLUDED.min_num),
+                    max_num = GREATEST(s.max_num, EXCLUDED.max_num);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER randomitem_summary_insert
+        AFTER INSERT ON randomitem REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION update_randomitem_summary()
+    """)
+    op.execute("""
+        CREATE TRIGGER randomitem_summary_update
+        AFTER UPDATE ON randomitem REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION update_randomitem_summary()
+    """)
+    op.execute("""
+        CREATE TRIGGER randomitem_summary_delete
+        AFTER DELETE ON randomitem REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION update_randomitem_summary()
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS randomitem_summary_delete ON randomitem")
+    op.execute("DROP TRIGGER IF EXISTS randomitem_summary_update ON randomitem")
+    op.execute("DROP TRIGGER IF EXISTS randomitem_summary_insert ON randomitem")
+    op.execute("DROP FUNCTION IF EXISTS update_randomitem_summary()")
+    op.drop_index('ix_randomitem_user_id_num', table_name='randomitem')
+    op.drop_table('randomitemsummary')
@@ -2,17 +2,85 @@ import base64
 import hashlib
 import hmac
 import os
+import re
+import time
+from functools import lru_cache
 
-import boto3
-import httpx
-from jose import JWTError, jwt
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, EmailStr, Field, field_validator
+
+from app.core.executors import BoundedExecutor
+from app.core.jwks import JWKSKeyStore
+from app.core.metrics import COGNITO_CALL_LATENCY
 
 AWS_REGION = os.getenv("AWS_REGION")
 AWS_COGNITO_APP_CLIENT_ID = os.getenv("AWS_COGNITO_APP_CLIENT_ID")
 # Since we enabled client secret we need to create secret hash for each api call
 AWS_COGNITO_APP_CLIENT_SECRET = os.getenv("AWS_COGNITO_APP_CLIENT_SECRET")
 AWS_USER_POOL_ID = os.getenv("AWS_USER_POOL_ID")
+AWS_COGNITO_JWKS_TTL = float(os.getenv("AWS_COGNITO_JWKS_TTL", "3600"))
+AWS_COGNITO_MAX_POOL_CONNECTIONS = int(os.getenv("AWS_COGNITO_MAX_POOL_CONNECTIONS", "10"))
+AWS_COGNITO_CONNECT_TIMEOUT = float(os.getenv("AWS_COGNITO_CONNECT_TIMEOUT", "2"))
+AWS_COGNITO_READ_TIMEOUT = float(os.getenv("AWS_COGNITO_READ_TIMEOUT", "5"))
+AWS_COGNITO_RETRY_MODE = os.getenv("AWS_COGNITO_RETRY_MODE", "standard")
+AWS_COGNITO_MAX_ATTEMPTS = int(os.getenv("AWS_COGNITO_MAX_ATTEMPTS", "3"))
+# Must match the user pool's password policy (defaults are Cognito's), so a password Cognito
+# would reject is refused at signup instead of failing later in the outbox
+AWS_COGNITO_PASSWORD_MIN_LENGTH = int(os.getenv("AWS_COGNITO_PASSWORD_MIN_LENGTH", "8"))
+AWS_COGNITO_PASSWORD_REQUIRE_UPPERCASE = os.getenv("AWS_COGNITO_PASSWORD_REQUIRE_UPPERCASE", "true").lower() == "true"
+AWS_COGNITO_PASSWORD_REQUIRE_LOWERCASE = os.getenv("AWS_COGNITO_PASSWORD_REQUIRE_LOWERCASE", "true").lower() == "true"
+AWS_COGNITO_PASSWORD_REQUIRE_NUMBERS = os.getenv("AWS_COGNITO_PASSWORD_REQUIRE_NUMBERS", "true").lower() == "true"
+AWS_COGNITO_PASSWORD_REQUIRE_SYMBOLS = os.getenv("AWS_COGNITO_PASSWORD_REQUIRE_SYMBOLS", "true").lower() == "true"
+
+# The special characters Cognito accepts, space included
+PASSWORD_SYMBOLS = re.compile(r"""[\^$*.\[\]{}()?"!@#%&/\\,><':;|_~`=+\- ]""")
+
+# Shared by every AWSCognito instance so the key set is fetched once per worker, not per request
+jwks_store = JWKSKeyStore(
+    f"https://cognito-idp.{AWS_REGION}.amazonaws.com/{AWS_USER_POOL_ID}/.well-known/jwks.json",
+    ttl=AWS_COGNITO_JWKS_TTL,
+)
+
+
+def create_cognito_client():
+    """Creates a cognito-idp client; the client is thread safe and meant to be shared."""
+    # boto3 is slow to import, load it when the client is created rather than on worker boot
+    import boto3
+    from botocore.config import Config
+
+    config = Config(
+        region_name=AWS_REGION,
+        max_pool_connections=AWS_COGNITO_MAX_POOL_CONNECTIONS,
+        connect_timeout=AWS_COGNITO_CONNECT_TIMEOUT,
+        read_timeout=AWS_COGNITO_READ_TIMEOUT,
+        retries={"mode": AWS_COGNITO_RETRY_MODE, "total_max_attempts": AWS_COGNITO_MAX_ATTEMPTS},
+    )
+    return boto3.client("cognito-idp", config=config)
+
+
+@lru_cache(maxsize=4096)
+def get_secret_hash(username: str) -> str:
+    return base64.b64encode(
+        hmac.new(
+            bytes(AWS_COGNITO_APP_CLIENT_SECRET, "utf-8"),
+            bytes(username + AWS_COGNITO_APP_CLIENT_ID, "utf-8"),
+            digestmod=hashlib.sha256,
+        ).digest()
+    ).decode()
+
+
+def password_policy_errors(password: str) -> list[str]:
+    errors = []
+    if len(password) < AWS_COGNITO_PASSWORD_MIN_LENGTH:
+        errors.append(f"at least {AWS_COGNITO_PASSWORD_MIN_LENGTH} characters")
+    if AWS_COGNITO_PASSWORD_REQUIRE_UPPERCASE and not re.search("[A-Z]", password):
+        errors.append("an uppercase letter")
+    if AWS_COGNITO_PASSWORD_REQUIRE_LOWERCASE and not re.search("[a-z]", password):
+        errors.append("a lowercase letter")
+    if AWS_COGNITO_PASSWORD_REQUIRE_NUMBERS and not re.search("[0-9]", password):
+        errors.append("a number")
+    if AWS_COGNITO_PASSWORD_REQUIRE_SYMBOLS and not PASSWORD_SYMBOLS.search(password):
+        errors.append("a special character")
+    return errors
 
 
 class UserSignup(BaseModel):
@@ -20,6 +88,14 @@ class UserSignup(BaseModel):
     email: EmailStr
     password: str
 
+    @field_validator("password")
+    @classmethod
+    def check_password_policy(cls, password: str) -> str:
+        errors = password_policy_errors(password)
+        if errors:
+            raise ValueError(f"password needs {', '.join(errors)}")
+        return password
+
 
 class UserSignin(BaseModel):
     username: str
@@ -32,17 +108,11 @@ class UserVerify(BaseModel):
 
 
 class AWSCognito:
-    def __init__(self):
-        self.client = boto3.client("cognito-idp", region_name=AWS_REGION)
+    def __init__(self, client=None):
+        self.client = client or create_cognito_client()
 
     def user_signup(self, user: UserSignup):
-        secret_hash = base64.b64encode(
-            hmac.new(
-                bytes(AWS_COGNITO_APP_CLIENT_SECRET, "utf-8"),
-                bytes(user.username + AWS_COGNITO_APP_CLIENT_ID, "utf-8"),
-                digestmod=hashlib.sha256,
-            ).digest()
-        ).decode()
+        secret_hash = get_secret_hash(user.username)
 
         response = self.client.sign_up(
             ClientId=AWS_COGNITO_APP_CLIENT_ID,
@@ -58,13 +128,7 @@ class AWSCognito:
         return response
 
     def verify_account(self, data: UserVerify):
-        secret_hash = base64.b64encode(
-            hmac.new(
-                bytes(AWS_COGNITO_APP_CLIENT_SECRET, "utf-8"),
-                bytes(data.username + AWS_COGNITO_APP_CLIENT_ID, "utf-8"),
-                digestmod=hashlib.sha256,
-            ).digest()
-        ).decode()
+        secret_hash = get_secret_hash(data.username)
 
         response = self.client.confirm_sign_up(
             ClientId=AWS_COGNITO_APP_CLIENT_ID,
@@ -78,13 +142,7 @@ class AWSCognito:
     def resend_confirmation_code(self, username: str):
         """Sends the confirmation code"""
 
-        secret_hash = base64.b64encode(
-            hmac.new(
-                bytes(AWS_COGNITO_APP_CLIENT_SECRET, "utf-8"),
-                bytes(username + AWS_COGNITO_APP_CLIENT_ID, "utf-8"),
-                digestmod=hashlib.sha256,
-            ).digest()
-        ).decode()
+        secret_hash = get_secret_hash(username)
 
         response = self.client.resend_confirmation_code(
             ClientId=AWS_COGNITO_APP_CLIENT_ID,
@@ -95,13 +153,7 @@ class AWSCognito:
         return response
 
     def user_signin(self, data: UserSignin):
-        secret_hash = base64.b64encode(
-            hmac.new(
-                bytes(AWS_COGNITO_APP_CLIENT_SECRET, "utf-8"),
-                bytes(data.username + AWS_COGNITO_APP_CLIENT_ID, "utf-8"),
-                digestmod=hashlib.sha256,
-            ).digest()
-        ).decode()
+        secret_hash = get_secret_hash(data.username)
 
         response = self.client.initiate_auth(
             ClientId=AWS_COGNITO_APP_CLIENT_ID,
@@ -120,29 +172,40 @@ class AWSCognito:
 
         return response
 
+    def list_users(self, pagination_token: str | None = None, limit: int = 60):
+        """Lists one page of the user pool (60 users at most); needs cognito-idp:ListUsers."""
+        kwargs = {"UserPoolId": AWS_USER_POOL_ID, "Limit": limit}
+        if pagination_token is not None:
+            kwargs["PaginationToken"] = pagination_token
+
+        response = self.client.list_users(**kwargs)
+
+        return response
+
     def get_jwks(self):
         """Fetches the JSON Web Key Set (JWKS) from Cognito."""
-        jwks_url = f"https://cognito-idp.{AWS_REGION}.amazonaws.com/{AWS_USER_POOL_ID}/.well-known/jwks.json"
-        response = httpx.get(jwks_url)
-        return response.json()
+        return jwks_store.fetch_jwks()
+
+    def has_signing_key(self, token: str) -> bool:
+        """Whether decode_token can verify `token` without fetching the JWKS."""
+        from jose import JWTError, jwt
+
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+        except JWTError:
+            # decode_token rejects the token straight away, no fetch involved
+            return True
+        return jwks_store.has_key(kid)
 
     def decode_token(self, token: str):
-        jwks = self.get_jwks()
-        unverified_header = jwt.get_unverified_header(token)
-        rsa_key = {}
+        from jose import JWTError, jwt
 
-        for key in jwks["keys"]:
-            if key["kid"] == unverified_header["kid"]:
-                rsa_key = {
-                    "kty": key["kty"],
-                    "kid": key["kid"],
-                    "use": key["use"],
-                    "n": key["n"],
-                    "e": key["e"],
-                }
+        unverified_header = jwt.get_unverified_header(token)
+        rsa_key = jwks_store.get_key(unverified_header.get("kid"))
 
-        if not rsa_key:
-            raise Exception("Unable to find appropriate key")
+        # A JWTError like every other rejected token, so the caller answers 401
+        if rsa_key is None:
+            raise JWTError("Unable to find appropriate key")
 
         try:
             payload = jwt.decode(
@@ -156,3 +219,39 @@ class AWSCognito:
             return payload
         except JWTError:
             raise JWTError
+
+
+class AsyncAWSCognito:
+    """Runs the blocking AWSCognito calls on a bounded thread pool so they don't stall the event loop."""
+
+    def __init__(self, cognito: AWSCognito, executor: BoundedExecutor):
+        self.cognito = cognito
+        self.executor = executor
+
+    async def _run(self, operation: str, fn, *args):
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await self.executor.run(fn, *args)
+            outcome = "ok"
+            return result
+        finally:
+            COGNITO_CALL_LATENCY.labels(operation, outcome).observe(time.perf_counter() - start)
+
+    async def user_signup(self, user: UserSignup):
+        return await self._run("user_signup", self.cognito.user_signup, user)
+
+    async def verify_account(self, data: UserVerify):
+        return await self._run("verify_account", self.cognito.verify_account, data)
+
+    async def resend_confirmation_code(self, username: str):
+        return await self._run("resend_confirmation_code", self.cognito.resend_confirmation_code, username)
+
+    async def user_signin(self, data: UserSignin):
+        return await self._run("user_signin", self.cognito.user_signin, data)
+
+    async def logout(self, access_token: str):
+        return await self._run("logout", self.cognito.logout, access_token)
+
+    async def list_users(self, pagination_token: str | None = None, limit: int = 60):
+        return await self._run("list_users", self.cognito.list_users, pagination_token, limit)
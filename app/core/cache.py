@@ -0,0 +1,212 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Protocol
+
+import orjson
+
+from app.core.metrics import (
+    CACHE_ENTRIES,
+    CACHE_EVICTIONS,
+    CACHE_EXPIRATIONS,
+    CACHE_LOOKUPS,
+)
+
+
+class TTLCache:
+    """Thread safe LRU cache whose entries also expire `ttl` seconds after being set."""
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = 60):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._hit_metric = CACHE_LOOKUPS.labels(name, "hit")
+        self._miss_metric = CACHE_LOOKUPS.labels(name, "miss")
+        self._eviction_metric = CACHE_EVICTIONS.labels(name)
+        self._expiration_metric = CACHE_EXPIRATIONS.labels(name)
+        self._entries_metric = CACHE_ENTRIES.labels(name)
+
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                    self.expirations += 1
+                    self._expiration_metric.inc()
+                    self._entries_metric.set(len(self._entries))
+                self.misses += 1
+                self._miss_metric.inc()
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self._hit_metric.inc()
+            return entry[1]
+
+    def set(self, key, value, ttl: float | None = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+                self._eviction_metric.inc()
+            self._entries_metric.set(len(self._entries))
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries_metric.set(len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._entries_metric.set(0)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class CacheBackend(Protocol):
+    """Shared cache tier; the operations map one to one onto Redis GET, SET EX and INCR."""
+
+    def get(self, key: str) -> bytes | int | None: ...
+
+    def set(self, key: str, value: bytes, ttl: float): ...
+
+    def incr(self, key: str) -> int: ...
+
+
+class SQLiteCacheBackend:
+    """CacheBackend in a SQLite file, shared by the workers of one host (or standing in for a network cache)."""
+
+    def __init__(self, path: str, purge_every: int = 1000):
+        self.path = path
+        self.purge_every = purge_every
+        self._writes = 0
+        self._local = threading.local()
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, expires_at REAL)"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between threads, keep one per thread
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key: str):
+        row = self._connection().execute(
+            "SELECT value FROM cache WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time()),
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: bytes, ttl: float):
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, time.time() + ttl),
+        )
+        self._writes += 1
+        if self._writes % self.purge_every == 0:
+            connection.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+
+    def incr(self, key: str) -> int:
+        return self._connection().execute(
+            "INSERT INTO cache (key, value, expires_at) VALUES (?, 1, NULL) "
+            "ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1 RETURNING value",
+            (key,),
+        ).fetchone()[0]
+
+
+class UserScopedCache:
+    """Two tier cache of per-user entries, all of which are dropped at once by `invalidate`.
+
+    Keys embed a per-user version that `invalidate` bumps, so stale entries are never
+    read again and simply age out. Without a shared tier the versions live in this
+    worker only, and writes made through other workers show up once entries expire.
+    Values must be JSON serializable to go through the shared tier.
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = 5, shared: CacheBackend | None = None):
+        self.name = name
+        self.ttl = ttl
+        self.shared = shared
+        self.local = TTLCache(name, maxsize=maxsize, ttl=ttl)
+        self._versions: dict = {}
+        self._shared_hit_metric = CACHE_LOOKUPS.labels(f"{name}_shared", "hit")
+        self._shared_miss_metric = CACHE_LOOKUPS.labels(f"{name}_shared", "miss")
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    async def _version(self, user_id) -> int:
+        if self.shared is None:
+            return self._versions.get(user_id, 0)
+        return int(await asyncio.to_thread(self.shared.get, f"{self.name}:version:{user_id}") or 0)
+
+    async def get_or_load(self, user_id, key: str, load):
+        """Returns the cached value of `key` for the user, awaiting `load()` on a miss.
+
+        None results are not cached.
+        """
+        if not self.enabled:
+            return await load()
+
+        # Read the version once, so a value loaded while a write invalidates the user
+        # is stored under the old version and never served afterwards
+        version = await self._version(user_id)
+        local_key = (user_id, version, key)
+        shared_key = f"{self.name}:{user_id}:{version}:{key}"
+
+        value = self.local.get(local_key)
+        if value is not None:
+            return value
+
+        if self.shared is not None:
+            raw = await asyncio.to_thread(self.shared.get, shared_key)
+            if raw is not None:
+                self._shared_hit_metric.inc()
+                value = orjson.loads(raw)
+                self.local.set(local_key, value)
+                return value
+            self._shared_miss_metric.inc()
+
+        value = await load()
+        if value is not None:
+            self.local.set(local_key, value)
+            if self.shared is not None:
+                await asyncio.to_thread(self.shared.set, shared_key, orjson.dumps(value), self.ttl)
+        return value
+
+    async def invalidate(self, user_id):
+        if not self.enabled:
+            return
+
+        self._versions[user_id] = self._versions.get(user_id, 0) + 1
+        if self.shared is not None:
+            await asyncio.to_thread(self.shared.incr, f"{self.name}:version:{user_id}")
@@ -0,0 +1,38 @@
+import hashlib
+
+
+def item_etag(item) -> str:
+    """Strong ETag of a random item, the md5 of its public fields joined by ':'.
+
+    The same digest is computed in SQL to check If-Match inside UPDATE and DELETE statements.
+    """
+    digest = hashlib.md5(
+        f"{item['id']}:{item['min_value']}:{item['max_value']}:{item['num']}".encode(), usedforsecurity=False
+    ).hexdigest()
+    return f'"{digest}"'
+
+
+def list_etag(user_id: int, version: int) -> str:
+    """Strong ETag of a user's item list, which only changes when the user's items do."""
+    return f'"{user_id}-{version}"'
+
+
+def parse_etags(header: str) -> list[str]:
+    """Splits an If-Match/If-None-Match header into its entity tags, weak ones keep their W/ prefix."""
+    return [tag.strip() for tag in header.split(",") if tag.strip()]
+
+
+def none_match(header: str | None, etag: str) -> bool:
+    """True if If-None-Match `header` matches `etag`, using the weak comparison RFC 9110 requires."""
+    if header is None:
+        return False
+    tags = parse_etags(header)
+    return "*" in tags or etag in (tag.removeprefix("W/") for tag in tags)
+
+
+def if_match_digests(header: str) -> list[str] | None:
+    """Opaque digests of the strong tags in If-Match `header`, or None when it is "*" (any current item)."""
+    tags = parse_etags(header)
+    if "*" in tags:
+        return None
+    return [tag.strip('"') for tag in tags if not tag.startswith("W/")]
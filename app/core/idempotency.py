@@ -0,0 +1,221 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Protocol
+
+logger = logging.getLogger(__name__)
+
+MAX_KEY_LENGTH = 255
+
+
+@dataclass
+class StoredResponse:
+    status_code: int
+    headers: list[tuple[bytes, bytes]]
+    body: bytes
+
+
+@dataclass
+class IdempotencyRecord:
+    fingerprint: str
+    expires_at: float
+    response: StoredResponse | None = None
+    settled: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+class IdempotencyStore(Protocol):
+    """Where IdempotencyMiddleware keeps keys, see also DatabaseIdempotencyStore (app/services/idempotency.py)."""
+
+    async def reserve(self, key: str, fingerprint: str) -> IdempotencyRecord | None:
+        """Claims `key` for the caller and returns None, or returns the live record already holding it."""
+
+    async def wait(self, key: str, timeout: float) -> bool:
+        """Waits for the request holding `key` to complete or release it; False on timeout."""
+
+    async def complete(self, key: str, response: StoredResponse): ...
+
+    async def release(self, key: str): ...
+
+    async def purge(self) -> int:
+        """Drops every expired key at once and returns how many went."""
+
+
+class InMemoryIdempotencyStore:
+    """IdempotencyStore of one worker; retries landing on another worker aren't deduplicated."""
+
+    def __init__(self, ttl: float = 24 * 60 * 60, maxsize: int = 10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._records: OrderedDict[str, IdempotencyRecord] = OrderedDict()
+
+    async def reserve(self, key: str, fingerprint: str) -> IdempotencyRecord | None:
+        record = self._records.get(key)
+        if record is not None and record.expires_at > time.monotonic():
+            return record
+
+        self._records[key] = IdempotencyRecord(fingerprint, time.monotonic() + self.ttl)
+        self._records.move_to_end(key)
+        while len(self._records) > self.maxsize:
+            # Whoever waits on an evicted record still holds it and gets woken up
+            self._records.popitem(last=False)[1].settled.set()
+        return None
+
+    async def wait(self, key: str, timeout: float) -> bool:
+        record = self._records.get(key)
+        if record is None:
+            return True
+        try:
+            await asyncio.wait_for(record.settled.wait(), timeout)
+        except TimeoutError:
+            return False
+        return True
+
+    async def complete(self, key: str, response: StoredResponse):
+        record = self._records.get(key)
+        if record is not None:
+            record.response = response
+            record.expires_at = time.monotonic() + self.ttl
+            record.settled.set()
+
+    async def release(self, key: str):
+        record = self._records.pop(key, None)
+        if record is not None:
+            record.settled.set()
+
+    async def purge(self) -> int:
+        now = time.monotonic()
+        expired = [key for key, record in self._records.items() if record.expires_at <= now]
+        for key in expired:
+            self._records.pop(key).settled.set()
+        return len(expired)
+
+
+async def purge_periodically(store: IdempotencyStore, interval: float):
+    """Background task removing expired keys in bulk every `interval` seconds."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            purged = await store.purge()
+        except Exception as e:
+            logger.warning(f"Unable to purge idempotency keys: {e}")
+        else:
+            if purged:
+                logger.info(f"Purged {purged} expired idempotency keys")
+
+
+class IdempotencyMiddleware:
+    """Replays the stored response of POST requests to `paths` that repeat an Idempotency-Key header.
+
+    Keys are scoped to the Authorization header, so two users can't see each other's responses.
+    A duplicate arriving while the first request still runs waits for it for up to
+    `wait_timeout` seconds, then gets 409. Reusing a key with a different request is a 422.
+    5xx responses and failed requests release the key so the client can retry.
+    """
+
+    def __init__(self, app, store: IdempotencyStore, paths: set[str], wait_timeout: float = 10):
+        self.app = app
+        self.store = store
+        self.paths = paths
+        self.wait_timeout = wait_timeout
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        idempotency_key = headers.get(b"idempotency-key")
+        if idempotency_key is None:
+            await self.app(scope, receive, send)
+            return
+        if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+            await self._send_error(send, 400, "Invalid Idempotency-Key header")
+            return
+
+        # The whole body is part of the fingerprint, read it once and hand it on to the app
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+        key = hashlib.sha256(headers.get(b"authorization", b"") + b"\0" + idempotency_key).hexdigest()
+        fingerprint = hashlib.sha256(
+            scope["path"].encode() + b"?" + scope["query_string"] + b"\0" + body
+        ).hexdigest()
+
+        deadline = time.monotonic() + self.wait_timeout
+        while (record := await self.store.reserve(key, fingerprint)) is not None:
+            if record.fingerprint != fingerprint:
+                await self._send_error(send, 422, "Idempotency-Key was already used with a different request")
+                return
+            if record.response is not None:
+                await self._replay(send, record.response)
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not await self.store.wait(key, remaining):
+                await self._send_error(send, 409, "A request with this Idempotency-Key is still in progress")
+                return
+
+        body_sent = False
+
+        async def receive_body():
+            nonlocal body_sent
+            if body_sent:
+                return await receive()
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        status_code = 500
+        response_headers = []
+        response_body = []
+
+        async def send_and_record(message):
+            nonlocal status_code, response_headers
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                response_headers = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                response_body.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_body, send_and_record)
+        except BaseException:
+            await self.store.release(key)
+            raise
+
+        if status_code >= 500:
+            await self.store.release(key)
+        else:
+            await self.store.complete(key, StoredResponse(status_code, response_headers, b"".join(response_body)))
+
+    @staticmethod
+    async def _replay(send, response: StoredResponse):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": response.headers + [(b"idempotent-replayed", b"true")],
+            }
+        )
+        await send({"type": "http.response.body", "body": response.body})
+
+    @staticmethod
+    async def _send_error(send, status_code: int, detail: str):
+        body = json.dumps({"detail": detail}).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status_code,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
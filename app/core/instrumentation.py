@@ -0,0 +1,130 @@
+import json
+import logging
+import os
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from starlette.datastructures import MutableHeaders
+
+logger = logging.getLogger(__name__)
+
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "200"))
+
+
+@dataclass
+class QueryStats:
+    """SQL work done on behalf of one request, times in seconds."""
+
+    count: int = 0
+    db_time: float = 0.0
+    checkout_wait: float = 0.0
+
+    def server_timing(self, total: float) -> str:
+        return (
+            f'db;dur={self.db_time * 1000:.2f};desc="{self.count} queries", '
+            f"db-checkout;dur={self.checkout_wait * 1000:.2f}, "
+            f"total;dur={total * 1000:.2f}"
+        )
+
+
+# Set per request by QueryStatsMiddleware; SQLAlchemy copies the context into the greenlets
+# running async queries and FastAPI into the threads running sync dependencies
+query_stats: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+
+def parameters_shape(parameters) -> str:
+    """Describes bound parameters by name and type only, so slow query logs never contain values."""
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{name}: {type(value).__name__}" for name, value in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            return f"{len(parameters)} x {parameters_shape(parameters[0])}"
+        return "(" + ", ".join(type(value).__name__ for value in parameters) + ")"
+    return type(parameters).__name__
+
+
+class CheckoutTimingMixin:
+    """Adds the time spent waiting for a pooled connection to the current request's stats."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            stats = query_stats.get()
+            if stats is not None:
+                stats.checkout_wait += time.perf_counter() - start
+
+
+class TimedQueuePool(CheckoutTimingMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(CheckoutTimingMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def instrument_engine(engine, slow_query_ms: float = DB_SLOW_QUERY_MS):
+    """Counts and times every statement run on `engine` (the sync_engine of an AsyncEngine)."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, *_):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, _cursor, statement, parameters, *_):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        stats = query_stats.get()
+        if stats is not None:
+            stats.count += 1
+            stats.db_time += elapsed
+        if elapsed * 1000 >= slow_query_ms:
+            logger.warning(
+                f"Slow query ({elapsed * 1000:.1f} ms): {statement} parameters={parameters_shape(parameters)}"
+            )
+
+
+class QueryStatsMiddleware:
+    """Reports the SQL work of each request in a Server-Timing header and a JSON log line."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = query_stats.set(stats)
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", stats.server_timing(time.perf_counter() - start))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            query_stats.reset(token)
+            logger.info(
+                json.dumps(
+                    {
+                        "method": scope["method"],
+                        "path": scope["path"],
+                        "status": status_code,
+                        "queries": stats.count,
+                        "db_ms": round(stats.db_time * 1000, 2),
+                        "checkout_ms": round(stats.checkout_wait * 1000, 2),
+                        "total_ms": round((time.perf_counter() - start) * 1000, 2),
+                    }
+                )
+            )
@@ -0,0 +1,105 @@
+import logging
+import threading
+import time
+
+from app.core.metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+
+class JWKSKeyStore:
+    """Holds the parsed public keys of a JSON Web Key Set, indexed by `kid`.
+
+    Keys are refreshed in a background thread shortly before the TTL runs out.
+    An unknown `kid` triggers one synchronous re-fetch which concurrent callers
+    share, and the last good key set keeps being served while the endpoint is down.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        ttl: float = 3600,
+        refresh_ahead: float = 300,
+        min_refetch_interval: float = 30,
+        timeout: float = 5,
+    ):
+        self.url = url
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self.min_refetch_interval = min_refetch_interval
+        self.timeout = timeout
+
+        self._keys = {}
+        self._expires_at = 0.0
+        self._last_attempt = float("-inf")
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._hit_metric = CACHE_LOOKUPS.labels("jwks", "hit")
+        self._miss_metric = CACHE_LOOKUPS.labels("jwks", "miss")
+
+    def fetch_jwks(self) -> dict:
+        """Fetches the raw JSON Web Key Set."""
+        import httpx
+
+        response = httpx.get(self.url, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def get_key(self, kid: str):
+        """Returns the public key for `kid`, or None if the key set doesn't contain it."""
+        generation = self._generation
+        key = self._keys.get(kid)
+        now = time.monotonic()
+
+        if key is None:
+            self._miss_metric.inc()
+            # Possibly a key rotation; re-fetch once (or wait for the fetch already
+            # in flight), but don't let tokens with made up kids hammer the endpoint
+            if self._lock.locked() or now - self._last_attempt >= self.min_refetch_interval:
+                self._fetch(generation)
+                key = self._keys.get(kid)
+        else:
+            self._hit_metric.inc()
+            if now >= self._expires_at - self.refresh_ahead:
+                self._refresh_in_background()
+
+        return key
+
+    def has_key(self, kid: str) -> bool:
+        """Whether `kid` is cached, in which case get_key returns without blocking."""
+        return kid in self._keys
+
+    def prefetch(self):
+        """Loads the key set up front so the first authenticated request doesn't wait for it."""
+        self._fetch(self._generation)
+
+    def _refresh_in_background(self):
+        now = time.monotonic()
+        if self._lock.locked() or now - self._last_attempt < self.min_refetch_interval:
+            return
+        self._last_attempt = now
+        threading.Thread(
+            target=self._fetch, args=(self._generation,), name="jwks-refresh", daemon=True
+        ).start()
+
+    def _fetch(self, generation: int):
+        import httpx
+        from jose import jwk
+        from jose.exceptions import JWKError
+
+        with self._lock:
+            # Another caller fetched while we waited for the lock, reuse its result
+            if self._generation != generation:
+                return
+
+            self._last_attempt = time.monotonic()
+            try:
+                jwks = self.fetch_jwks()
+                keys = {key["kid"]: jwk.construct(key, algorithm="RS256") for key in jwks["keys"]}
+            except (httpx.HTTPError, ValueError, KeyError, JWKError) as e:
+                logger.warning(f"Unable to refresh JWKS, serving {len(self._keys)} cached keys: {e}")
+            else:
+                self._keys = keys
+                self._expires_at = time.monotonic() + self.ttl
+            finally:
+                self._generation += 1
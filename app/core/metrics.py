@@ -0,0 +1,131 @@
+import os
+import time
+
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+
+# With PROMETHEUS_MULTIPROC_DIR set (see boot.sh) every worker writes its samples to files in that
+# directory and /metrics aggregates them, whichever worker answers the scrape
+MULTIPROCESS = "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Request latency by route template", ["method", "route", "status"]
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Requests currently being served", multiprocess_mode="livesum"
+)
+DB_POOL_SIZE = Gauge("db_pool_size", "Connections kept in the pool", ["engine"], multiprocess_mode="livesum")
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out", "Connections currently checked out", ["engine"], multiprocess_mode="livesum"
+)
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_overflow", "Connections opened beyond the pool size", ["engine"], multiprocess_mode="livesum"
+)
+CACHE_LOOKUPS = Counter("cache_lookups_total", "Cache lookups by cache and result", ["cache", "result"])
+# Evictions mean maxsize is too small for the working set, expirations that the TTL is too short
+CACHE_EVICTIONS = Counter("cache_evictions_total", "Entries dropped to stay within maxsize", ["cache"])
+CACHE_EXPIRATIONS = Counter("cache_expirations_total", "Entries found expired on lookup", ["cache"])
+CACHE_ENTRIES = Gauge("cache_entries", "Entries currently cached", ["cache"], multiprocess_mode="livesum")
+# livemin, so a single worker that lost its LISTEN connection shows up as 0
+PG_LISTEN_CONNECTED = Gauge(
+    "pg_listen_connected", "Whether the LISTEN connection of a channel is up", ["channel"], multiprocess_mode="livemin"
+)
+PG_LISTEN_LOST = Counter("pg_listen_lost_total", "LISTEN connections lost", ["channel"])
+COGNITO_CALL_LATENCY = Histogram(
+    "cognito_call_duration_seconds", "Cognito API call latency", ["operation", "outcome"]
+)
+# Every worker reads the same table-wide count, so aggregate with max rather than sum
+OUTBOX_PENDING = Gauge(
+    "cognito_outbox_pending", "Outbox messages waiting to be sent to Cognito", multiprocess_mode="livemax"
+)
+OUTBOX_MESSAGES = Counter(
+    "cognito_outbox_messages_total", "Outbox messages handled by the dispatcher", ["operation", "outcome"]
+)
+OUTBOX_DRAIN_LATENCY = Histogram(
+    "cognito_outbox_drain_seconds",
+    "Time from writing an outbox message to Cognito accepting it",
+    ["operation"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600),
+)
+USER_RECONCILE_CHANGES = Counter(
+    "user_reconcile_changes_total", "Local users changed by the Cognito reconciliation", ["action"]
+)
+USER_RECONCILE_LATENCY = Histogram("user_reconcile_duration_seconds", "Duration of a Cognito reconciliation run")
+
+
+def generate_metrics() -> bytes:
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def mark_process_dead():
+    """Drops this worker's live gauges; called when the worker shuts down."""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def instrument_pool_metrics(engine, name: str):
+    """Keeps the pool gauges of `engine` (the sync_engine of an AsyncEngine) up to date."""
+    size = DB_POOL_SIZE.labels(name)
+    checked_out = DB_POOL_CHECKED_OUT.labels(name)
+    overflow = DB_POOL_OVERFLOW.labels(name)
+
+    def update():
+        size.set(engine.pool.size())
+        overflow.set(max(engine.pool.overflow(), 0))
+
+    # The pool's own counters still include a connection while its checkin event runs,
+    # so track checked out connections from the events themselves
+    def on_checkout(*_):
+        checked_out.inc()
+        update()
+
+    def on_checkin(*_):
+        checked_out.dec()
+        update()
+
+    event.listen(engine, "checkout", on_checkout)
+    event.listen(engine, "checkin", on_checkin)
+
+
+class MetricsMiddleware:
+    """Records latency by route template (not raw path, to keep label cardinality bounded)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                scope["method"], route.path if route is not None else "unmatched", str(status_code)
+            ).observe(time.perf_counter() - start)
+
@@ -0,0 +1,20 @@
+import base64
+import json
+
+
+def encode_cursor(last_id: int) -> str:
+    """Opaque keyset cursor pointing just after the row with id `last_id`."""
+    return base64.urlsafe_b64encode(json.dumps({"id": last_id}).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """Returns the id encoded in `cursor`, raising ValueError if it wasn't made by encode_cursor."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        last_id = data["id"]
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError("invalid cursor") from e
+
+    if not isinstance(last_id, int):
+        raise ValueError("invalid cursor")
+    return last_id
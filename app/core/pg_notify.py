@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import random
+
+import asyncpg
+
+from app.core.metrics import PG_LISTEN_CONNECTED, PG_LISTEN_LOST
+
+logger = logging.getLogger(__name__)
+
+
+class Listener:
+    """Dedicated connection that calls `on_notify(payload)` for every NOTIFY on `channel`.
+
+    Notifications sent while nobody listens are gone for good, so `on_lost` is called when
+    the connection drops and again once it is re-established; reconnects are retried with
+    an exponential backoff of `min_backoff` up to `max_backoff` seconds.
+    """
+
+    def __init__(
+        self, dsn: str, channel: str, on_notify, on_lost=None, min_backoff: float = 1, max_backoff: float = 60
+    ):
+        self.dsn = dsn
+        self.channel = channel
+        self.on_notify = on_notify
+        self.on_lost = on_lost
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+
+        self._connection: asyncpg.Connection | None = None
+        self._reconnect_task: asyncio.Task | None = None
+        self._closed = False
+        self._connected_metric = PG_LISTEN_CONNECTED.labels(channel)
+        self._lost_metric = PG_LISTEN_LOST.labels(channel)
+
+    async def connect(self):
+        connection = await asyncpg.connect(self.dsn)
+        try:
+            await connection.add_listener(self.channel, self._notified)
+        except BaseException:
+            await connection.close()
+            raise
+        connection.add_termination_listener(self._terminated)
+        self._connection = connection
+        self._connected_metric.set(1)
+
+    async def close(self):
+        self._closed = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            await asyncio.gather(self._reconnect_task, return_exceptions=True)
+        if self._connection is not None:
+            await self._connection.close()
+        self._connected_metric.set(0)
+
+    def _notified(self, _connection, _pid, _channel, payload):
+        self.on_notify(payload)
+
+    def _terminated(self, _connection):
+        self._connection = None
+        self._connected_metric.set(0)
+        if self._closed:
+            return
+
+        logger.warning(f"Lost the LISTEN connection for channel {self.channel}, reconnecting")
+        self._lost_metric.inc()
+        if self.on_lost is not None:
+            self.on_lost()
+        self._reconnect_task = asyncio.get_running_loop().create_task(self._reconnect())
+
+    async def _reconnect(self):
+        delay = self.min_backoff
+        while not self._closed:
+            await asyncio.sleep(delay * random.uniform(0.5, 1))
+            try:
+                await self.connect()
+            except Exception as e:
+                logger.warning(f"Unable to LISTEN on channel {self.channel}: {e}")
+                delay = min(delay * 2, self.max_backoff)
+                continue
+
+            logger.info(f"Listening on channel {self.channel} again")
+            # Whatever was notified while disconnected has been missed
+            if self.on_lost is not None:
+                self.on_lost()
+            return
+
+
+async def listen(dsn: str, channel: str, on_notify, on_lost=None) -> Listener:
+    """Starts a Listener, raising if the first connection fails. Close it to stop listening."""
+    listener = Listener(dsn, channel, on_notify, on_lost)
+    await listener.connect()
+    return listener
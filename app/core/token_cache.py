@@ -0,0 +1,110 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from app.core.metrics import (
+    CACHE_ENTRIES,
+    CACHE_EVICTIONS,
+    CACHE_EXPIRATIONS,
+    CACHE_LOOKUPS,
+)
+
+# Cognito access tokens live for at most a day, after which a revoked token fails verification anyway
+MAX_TOKEN_LIFETIME = 24 * 60 * 60
+
+
+class TokenCache:
+    """Bounded LRU of verified token claims keyed by the SHA-256 digest of the token.
+
+    Each entry expires at the token's `exp` claim. Tokens revoked through logout are
+    remembered until they would have expired so they can't be verified again in-process.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._hit_metric = CACHE_LOOKUPS.labels("token", "hit")
+        self._miss_metric = CACHE_LOOKUPS.labels("token", "miss")
+        self._eviction_metric = CACHE_EVICTIONS.labels("token")
+        self._expiration_metric = CACHE_EXPIRATIONS.labels("token")
+        self._entries_metric = CACHE_ENTRIES.labels("token")
+
+        self._entries: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self._revoked: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _digest(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str):
+        key = self._digest(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                self._miss_metric.inc()
+                return None
+
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                self.expirations += 1
+                self._expiration_metric.inc()
+                self._entries_metric.set(len(self._entries))
+                self.misses += 1
+                self._miss_metric.inc()
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self._hit_metric.inc()
+            return value
+
+    def put(self, token: str, value, expires_at: float):
+        if expires_at <= time.time():
+            return
+
+        key = self._digest(token)
+        with self._lock:
+            if key in self._revoked:
+                return
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+                self._eviction_metric.inc()
+            self._entries_metric.set(len(self._entries))
+
+    def revoke(self, token: str):
+        """Drops the cached claims of `token` and refuses to cache it again."""
+        key = self._digest(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            self._entries_metric.set(len(self._entries))
+            self._revoked[key] = entry[0] if entry else now + MAX_TOKEN_LIFETIME
+            self._revoked.move_to_end(key)
+            while self._revoked and (len(self._revoked) > self.maxsize or next(iter(self._revoked.values())) <= now):
+                self._revoked.popitem(last=False)
+
+    def is_revoked(self, token: str) -> bool:
+        expires_at = self._revoked.get(self._digest(token))
+        return expires_at is not None and expires_at > time.time()
+
+    def stats(self) -> dict:
+        """Counters used to size the cache."""
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "revoked": len(self._revoked),
+        }
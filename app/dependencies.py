@@ -1,20 +1,55 @@
+import asyncio
 import logging
 import os
+from functools import lru_cache
 from typing import Annotated
 
 from fastapi import Depends, HTTPException, Security, status
 from fastapi.security import OAuth2PasswordBearer, SecurityScopes
-from jwt.exceptions import InvalidTokenError
-from pwdlib import PasswordHash
+from jose import JWTError
 from pydantic import BaseModel
-from sqlmodel import Session, select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.aws_cognito import (
+    AWS_COGNITO_MAX_POOL_CONNECTIONS,
+    AsyncAWSCognito,
+    AWSCognito,
+)
+from app.core.cache import SQLiteCacheBackend, TTLCache, UserScopedCache
+from app.core.executors import BoundedExecutor
+from app.core.idempotency import InMemoryIdempotencyStore
+from app.core.token_cache import TokenCache
+from app.models import User, UserSnapshot, get_async_session
+from app.services.idempotency import DatabaseIdempotencyStore
+
+
+@lru_cache
+def get_aws_cognito() -> AWSCognito:
+    # One client per worker, so its connection pool and credentials are reused across requests
+    return AWSCognito()
 
-from app.core.aws_cognito import AWSCognito
-from app.models import User, get_session
 
+@lru_cache
+def get_password_hasher():
+    # Only signups hash passwords, so argon2 is loaded on first use instead of on worker boot
+    from pwdlib import PasswordHash
+    from pwdlib.hashers.argon2 import Argon2Hasher
 
-def get_aws_cognito() -> AWSCognito:
-    return AWSCognito()
+    return PasswordHash(
+        (Argon2Hasher(time_cost=ARGON2_TIME_COST, memory_cost=ARGON2_MEMORY_COST, parallelism=ARGON2_PARALLELISM),)
+    )
+
+
+@lru_cache
+def get_password_executor() -> BoundedExecutor:
+    return BoundedExecutor("password", PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
+
+
+@lru_cache
+def get_async_aws_cognito() -> AsyncAWSCognito:
+    executor = BoundedExecutor("cognito", COGNITO_EXECUTOR_WORKERS, COGNITO_EXECUTOR_MAX_PENDING)
+    return AsyncAWSCognito(get_aws_cognito(), executor)
 
 
 logging.basicConfig(level=logging.INFO)
@@ -25,11 +60,60 @@ logger = logging.getLogger(__name__)
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
-
-
-password_hash = PasswordHash.recommended()
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "1024"))
+# Threads making Cognito calls; more than the client's connection pool would just wait on connections
+COGNITO_EXECUTOR_WORKERS = int(os.getenv("COGNITO_EXECUTOR_WORKERS", str(AWS_COGNITO_MAX_POOL_CONNECTIONS)))
+COGNITO_EXECUTOR_MAX_PENDING = int(os.getenv("COGNITO_EXECUTOR_MAX_PENDING", "100"))
+# argon2-cffi releases the GIL while hashing, so a few threads per worker hash in parallel
+# without the pickling overhead of a process pool
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "16"))
+# argon2 cost parameters, memory in KiB; the defaults are the argon2-cffi (RFC 9106 low memory) ones
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "3"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "65536"))
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "4"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+# Drop cached users on every worker when a user row changes, via the user_changed trigger
+USER_CACHE_LISTEN = os.getenv("USER_CACHE_LISTEN", "false").lower() == "true"
+USER_CHANGED_CHANNEL = "user_changed"
+# Per-user cache of GET /randoms/ pages and items, off when the TTL is 0. With a SQLite file
+# as shared tier all workers of a host see each other's writes immediately
+RANDOMS_CACHE_SIZE = int(os.getenv("RANDOMS_CACHE_SIZE", "1024"))
+RANDOMS_CACHE_TTL = float(os.getenv("RANDOMS_CACHE_TTL", "0"))
+RANDOMS_CACHE_SQLITE_PATH = os.getenv("RANDOMS_CACHE_SQLITE_PATH")
+RANDOMS_EXPORT_FETCH_SIZE = int(os.getenv("RANDOMS_EXPORT_FETCH_SIZE", "1000"))
+# Serve GET /randoms/ from plain rows encoded with orjson instead of validating ORM objects
+RANDOMS_FAST_JSON = os.getenv("RANDOMS_FAST_JSON", "false").lower() == "true"
+RANDOMS_STATS_MAX_BUCKETS = int(os.getenv("RANDOMS_STATS_MAX_BUCKETS", "100"))
+# How long the single statement of PATCH/DELETE /randoms/bulk may run
+RANDOMS_BULK_STATEMENT_TIMEOUT_MS = int(os.getenv("RANDOMS_BULK_STATEMENT_TIMEOUT_MS", "5000"))
+# Responses to POSTs carrying an Idempotency-Key are kept this long (seconds) and replayed
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", str(24 * 60 * 60)))
+# "database" shares keys between workers through the idempotencykey table, "memory" keeps
+# at most IDEMPOTENCY_MAX_KEYS per worker
+IDEMPOTENCY_STORE = os.getenv("IDEMPOTENCY_STORE", "database")
+# Seconds a key stays held by a request that never finishes, e.g. when its worker dies
+IDEMPOTENCY_LEASE = float(os.getenv("IDEMPOTENCY_LEASE", "60"))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT", "10"))
+IDEMPOTENCY_PURGE_INTERVAL = float(os.getenv("IDEMPOTENCY_PURGE_INTERVAL", "60"))
+
+
+token_cache = TokenCache(maxsize=TOKEN_CACHE_SIZE)
+user_cache = TTLCache("user", maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+if IDEMPOTENCY_STORE == "memory":
+    idempotency_store = InMemoryIdempotencyStore(ttl=IDEMPOTENCY_TTL, maxsize=IDEMPOTENCY_MAX_KEYS)
+else:
+    idempotency_store = DatabaseIdempotencyStore(ttl=IDEMPOTENCY_TTL, lease=IDEMPOTENCY_LEASE)
+randoms_cache = UserScopedCache(
+    "randoms",
+    maxsize=RANDOMS_CACHE_SIZE,
+    ttl=RANDOMS_CACHE_TTL,
+    shared=SQLiteCacheBackend(RANDOMS_CACHE_SQLITE_PATH) if RANDOMS_CACHE_TTL > 0 and RANDOMS_CACHE_SQLITE_PATH else None,
+)
 reusable_oauth2 = OAuth2PasswordBearer(tokenUrl="/users/login", scopes={"me": "Information about user", "randoms": "Random numbers API"})
-SessionDep = Annotated[Session, Depends(get_session)]
+SessionDep = Annotated[AsyncSession, Depends(get_async_session)]
 TokenDep = Annotated[str, Depends(reusable_oauth2)]
 CognitoDep = Annotated[AWSCognito, Depends(get_aws_cognito)]
 
@@ -44,23 +128,28 @@ class TokenData(BaseModel):
     scopes: list[str] = []
 
 
-def verify_password(plain_password, hashed_password):
-    return password_hash.verify(plain_password, hashed_password)
+# Argon2 is deliberately slow, so hashing runs off the event loop and is rejected with 503
+# (ExecutorSaturated) rather than queued without bound during a burst of signups
+async def verify_password(plain_password, hashed_password):
+    return await get_password_executor().run(get_password_hasher().verify, plain_password, hashed_password)
 
 
-def get_password_hash(password):
-    return password_hash.hash(password)
+async def get_password_hash(password):
+    return await get_password_executor().run(get_password_hasher().hash, password)
 
 
-def get_user(username: str):
-    for session in get_session():
-        user = session.exec(select(User).where(User.username == username)).first()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        return user
+async def get_user(session: AsyncSession, username: str):
+    user = (await session.exec(select(User).where(User.username == username))).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
 
 
-async def get_current_user_cognito(security_scopes: SecurityScopes, cognito: CognitoDep, token: TokenDep):
+# SessionDep is cached per request, so the user lookup runs on the same session and
+# connection as the route handler instead of checking out a second one
+async def get_current_user_cognito(
+    security_scopes: SecurityScopes, cognito: CognitoDep, token: TokenDep, session: SessionDep
+):
     if security_scopes.scopes:
         authenticate_value = f"Bearer scope={security_scopes.scope_str}"
     else:
@@ -72,20 +161,37 @@ async def get_current_user_cognito(security_scopes: SecurityScopes, cognito: Cog
         headers={"WWW-Authenticate": authenticate_value},
     )
 
-    try:
-        payload = cognito.decode_token(token)
-        logger.info(f"PAYLOAD IN GET CURRENT USER: {payload}")
-        username = payload.get("username")
-        if username is None:
-            raise credentials_exception
-
-        scope: str = payload.get("scope", "")
-        token_scopes = scope.split(" ")
-        token_data = TokenData(scopes=token_scopes, username=username)
-    except InvalidTokenError:
+    if token_cache.is_revoked(token):
         raise credentials_exception
 
-    user = get_user(username)
+    # Clients resend the same bearer token many times, only verify it on the first request
+    token_data = token_cache.get(token)
+    if token_data is None:
+        try:
+            # A key missing from the JWKS cache is fetched over HTTP (or waited for while a
+            # refresh holds the lock), so that case runs off the event loop
+            if cognito.has_signing_key(token):
+                payload = cognito.decode_token(token)
+            else:
+                payload = await asyncio.to_thread(cognito.decode_token, token)
+            logger.info(f"PAYLOAD IN GET CURRENT USER: {payload}")
+            username = payload.get("username")
+            if username is None:
+                raise credentials_exception
+
+            scope: str = payload.get("scope", "")
+            token_scopes = scope.split(" ")
+            token_data = TokenData(scopes=token_scopes, username=username)
+        # decode_token verifies with python-jose, malformed, expired and badly signed tokens
+        # all raise its JWTError
+        except JWTError:
+            raise credentials_exception
+        token_cache.put(token, token_data, payload.get("exp", 0))
+
+    user = user_cache.get(token_data.username)
+    if user is None:
+        user = UserSnapshot.model_validate(await get_user(session, token_data.username))
+        user_cache.set(user.username, user)
     if user is None:
         raise credentials_exception
     
@@ -102,12 +208,12 @@ async def get_current_user_cognito(security_scopes: SecurityScopes, cognito: Cog
     return user
 
 
-async def get_current_active_user(current_user: Annotated[User, Security(get_current_user_cognito, scopes=["me"])]):
+async def get_current_active_user(current_user: Annotated[UserSnapshot, Security(get_current_user_cognito, scopes=["me"])]):
     if current_user.disabled:
         raise HTTPException(status_code=400, detail="Inactive user")
 
     return current_user
 
 
-CurrentActiveUser = Annotated[User, Depends(get_current_active_user)]
-CurrentActiveUserRandoms = Annotated[User, Security(get_current_active_user, scopes=["randoms"])]
+CurrentActiveUser = Annotated[UserSnapshot, Depends(get_current_active_user)]
+CurrentActiveUserRandoms = Annotated[UserSnapshot, Security(get_current_active_user, scopes=["randoms"])]
@@ -1,19 +1,50 @@
-from fastapi import FastAPI
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from sqlmodel import Session, select
+from fastapi.responses import JSONResponse
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from app.core.aws_cognito import jwks_store
+from app.core.executors import ExecutorSaturated
+from app.core.idempotency import IdempotencyMiddleware, purge_periodically
+from app.core.instrumentation import QueryStatsMiddleware
+from app.core.metrics import MetricsMiddleware, generate_metrics, mark_process_dead
+from app.core.pg_notify import listen
+from app.dependencies import (
+    IDEMPOTENCY_PURGE_INTERVAL,
+    IDEMPOTENCY_WAIT_TIMEOUT,
+    USER_CACHE_LISTEN,
+    USER_CHANGED_CHANNEL,
+    get_async_aws_cognito,
+    get_password_executor,
+    idempotency_store,
+    logger,
+    user_cache,
+)
+from app.models import async_engine, check_database, postgresql_url, prewarm_pool
+from app.routers import playground, randoms, users
+from app.services.outbox import OutboxDispatcher
+from app.services.reconcile import (
+    USER_RECONCILE_INTERVAL,
+    CognitoUserDirectory,
+    UserReconciler,
+)
 
-from app.dependencies import logger
-from app.models import engine
-from app.routers import randoms, users
+# Seconds each startup step may take before the worker gives up booting
+STARTUP_TIMEOUT = float(os.getenv("STARTUP_TIMEOUT", "10"))
+# Send queued Cognito calls from this worker; turn off to run the API without draining the outbox
+OUTBOX_DISPATCH = os.getenv("OUTBOX_DISPATCH", "true").lower() == "true"
 
-#### Testing DB
-logger.info("Initialize database...")
-try:
-    with Session(engine) as session:
-        session.exec(select(1))
-except Exception as e:
-    logger.error(e)
-    raise e
+
+async def prefetch_jwks():
+    # Tokens can still be verified without it, the keys are then fetched by the first request
+    try:
+        await asyncio.wait_for(asyncio.to_thread(jwks_store.prefetch), STARTUP_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"Unable to prefetch JWKS: {e}")
 
 
 # Customize swagger docs
@@ -27,22 +58,79 @@ tags_metadata = [
 ]
 
 
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    logger.info("Initialize database...")
+    # Independent steps, so a worker boots in the time of the slowest one rather than their sum
+    _, _, _, cognito = await asyncio.gather(
+        asyncio.wait_for(check_database(), STARTUP_TIMEOUT),
+        asyncio.wait_for(prewarm_pool(), STARTUP_TIMEOUT),
+        prefetch_jwks(),
+        # Create the shared Cognito client (and import boto3) before the first request needs it
+        asyncio.wait_for(asyncio.to_thread(get_async_aws_cognito), STARTUP_TIMEOUT),
+    )
+    listener = None
+    if USER_CACHE_LISTEN:
+        listener = await listen(
+            postgresql_url, USER_CHANGED_CHANNEL, on_notify=user_cache.delete, on_lost=user_cache.clear
+        )
+    tasks = [asyncio.create_task(purge_periodically(idempotency_store, IDEMPOTENCY_PURGE_INTERVAL))]
+    if OUTBOX_DISPATCH:
+        tasks.append(asyncio.create_task(OutboxDispatcher(cognito).run()))
+    if USER_RECONCILE_INTERVAL > 0:
+        reconciler = UserReconciler(CognitoUserDirectory(cognito))
+        tasks.append(asyncio.create_task(reconciler.run_periodically(USER_RECONCILE_INTERVAL)))
+    yield
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    if listener is not None:
+        await listener.close()
+    cognito.executor.shutdown()
+    get_password_executor().shutdown()
+    if async_engine is not None:
+        await async_engine.dispose()
+    mark_process_dead()
+
+
 app = FastAPI(
     title="Randomizer API",
     description="Generates random numbers between a min and max value",
     version="1.0.0",
     openapi_tags=tags_metadata,
+    lifespan=lifespan,
 )
 
+# Innermost, so replayed responses still get fresh CORS and Server-Timing headers
+app.add_middleware(
+    IdempotencyMiddleware,
+    store=idempotency_store,
+    paths={"/randoms/", "/randoms/batch", "/users/signup"},
+    wait_timeout=IDEMPOTENCY_WAIT_TIMEOUT,
+)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:8000"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Link", "X-Next-Cursor", "Server-Timing", "Idempotent-Replayed"],
 )
+app.add_middleware(QueryStatsMiddleware)
+app.add_middleware(MetricsMiddleware)
+
 
+@app.exception_handler(ExecutorSaturated)
+async def executor_saturated_handler(request: Request, exc: ExecutorSaturated):
+    logger.warning(f"Executor {exc} saturated, rejecting request to {request.url.path}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Service busy, try again later"},
+        headers={"Retry-After": "1"},
+    )
 
+
+app.include_router(playground.router)
 app.include_router(randoms.router)
 app.include_router(users.router)
 
@@ -50,3 +138,8 @@ app.include_router(users.router)
 @app.get("/", tags=["Random Playground"])
 def home():
     return {"message": "Home page of randomizer"}
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return Response(generate_metrics(), media_type=CONTENT_TYPE_LATEST)
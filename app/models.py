@@ -1,16 +1,113 @@
+import asyncio
 import os
-from typing import Self
+from contextlib import asynccontextmanager
+from datetime import UTC, datetime
+from typing import Annotated, Self
 
 from dotenv import load_dotenv
-from pydantic import model_validator
+from fastapi import Request
+from pydantic import BaseModel, ConfigDict, model_validator
+from pydantic import Field as PydanticField
+from sqlalchemy import BigInteger, Index, LargeBinary, select, text
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel import Field, Relationship, Session, SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.instrumentation import (
+    TimedAsyncAdaptedQueuePool,
+    TimedQueuePool,
+    instrument_engine,
+)
+from app.core.metrics import instrument_pool_metrics
 
 load_dotenv()
 
 postgresql_url = f"postgresql://{os.environ.get('RDS_USERNAME')}:{os.environ.get('RDS_PASSWORD')}@{os.environ.get('RDS_HOSTNAME')}:{os.environ.get('RDS_PORT')}/{os.environ.get('RDS_DB_NAME')}"
+asyncpg_url = postgresql_url.replace("postgresql://", "postgresql+asyncpg://", 1)
+
+# "async" runs queries on asyncpg; "sync" keeps the blocking psycopg2 path for comparison benchmarks
+DB_DRIVER = os.getenv("DB_DRIVER", "async")
+# Request size limits enforced by the schemas below: items per POST /randoms/batch, and ids
+# per PATCH/DELETE /randoms/bulk
+RANDOMS_MAX_BATCH_SIZE = int(os.getenv("RANDOMS_MAX_BATCH_SIZE", "1000"))
+RANDOMS_MAX_BULK_SIZE = int(os.getenv("RANDOMS_MAX_BULK_SIZE", "1000"))
+
+# Every worker has its own pool, so by default the server's connection budget is split between them
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "4"))
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "40"))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", str(max(DB_MAX_CONNECTIONS // WEB_CONCURRENCY // 2, 1))))
+DB_MAX_OVERFLOW = int(
+    os.getenv("DB_MAX_OVERFLOW", str(max(DB_MAX_CONNECTIONS // WEB_CONCURRENCY - DB_POOL_SIZE, 0)))
+)
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_POOL_PREWARM = int(os.getenv("DB_POOL_PREWARM", str(DB_POOL_SIZE)))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+
+pool_options = {
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+    "pool_recycle": DB_POOL_RECYCLE,
+    # Checks each connection on checkout and transparently replaces dead ones
+    "pool_pre_ping": DB_POOL_PRE_PING,
+}
+
+engine = create_engine(
+    postgresql_url,
+    connect_args={"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"},
+    poolclass=TimedQueuePool,
+    **pool_options,
+)
+instrument_engine(engine)
+instrument_pool_metrics(engine, "sync")
+
+async_engine = None
+if DB_DRIVER == "async":
+    async_engine = create_async_engine(
+        asyncpg_url,
+        connect_args={"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}},
+        poolclass=TimedAsyncAdaptedQueuePool,
+        **pool_options,
+    )
+    instrument_engine(async_engine.sync_engine)
+    instrument_pool_metrics(async_engine.sync_engine, "async")
+
+
+async def check_database():
+    """Runs a trivial query on the engine serving requests, raising if the database is unreachable."""
+    if async_engine is None:
+        await asyncio.to_thread(_check_sync_database)
+        return
+
+    async with async_engine.connect() as connection:
+        await connection.execute(select(1))
+
+
+def _check_sync_database():
+    with engine.connect() as connection:
+        connection.execute(select(1))
+
 
+def _prewarm_sync_pool(count: int):
+    connections = [engine.connect() for _ in range(count)]
+    for connection in connections:
+        connection.close()
 
-engine = create_engine(postgresql_url, connect_args={})
+
+async def prewarm_pool(count: int = DB_POOL_PREWARM):
+    """Opens `count` connections at once and returns them to the pool, so early requests don't pay for connecting."""
+    count = min(count, DB_POOL_SIZE)
+    if count <= 0:
+        return
+
+    if async_engine is None:
+        await asyncio.to_thread(_prewarm_sync_pool, count)
+        return
+
+    connections = await asyncio.gather(*(async_engine.connect().start() for _ in range(count)))
+    await asyncio.gather(*(connection.close() for connection in connections))
 
 
 def get_session():
@@ -18,6 +115,83 @@ def get_session():
         yield session
 
 
+class SyncSessionAdapter:
+    """Exposes a sync Session through the awaitable AsyncSession methods the routers use.
+
+    Every call still blocks the event loop; it only exists so DB_DRIVER=sync can be benchmarked
+    against the async driver with the same handlers.
+    """
+
+    def __init__(self, session: Session):
+        self.session = session
+
+    def add(self, instance):
+        self.session.add(instance)
+
+    async def exec(self, statement):
+        return self.session.exec(statement)
+
+    async def execute(self, statement, params=None):
+        return self.session.execute(statement, params)
+
+    async def commit(self):
+        self.session.commit()
+
+    async def rollback(self):
+        self.session.rollback()
+
+    async def refresh(self, instance):
+        self.session.refresh(instance)
+
+    async def delete(self, instance):
+        self.session.delete(instance)
+
+    async def close(self):
+        self.session.close()
+
+
+async def stream_partitions(statement, size: int):
+    """Yields the rows of `statement` in lists of at most `size`, read through a server-side cursor."""
+    if async_engine is None:
+        with engine.connect() as connection:
+            result = connection.execution_options(stream_results=True, max_row_buffer=size).execute(statement)
+            for partition in result.partitions(size):
+                yield partition
+    else:
+        async with async_engine.connect() as connection:
+            result = await connection.stream(statement.execution_options(yield_per=size))
+            async for partition in result.partitions(size):
+                yield partition
+
+
+@asynccontextmanager
+async def session_scope():
+    """Session for work done outside a request, such as background tasks and CLI jobs."""
+    if async_engine is None:
+        with Session(engine) as session:
+            yield SyncSessionAdapter(session)
+    else:
+        async with AsyncSession(async_engine) as session:
+            yield session
+
+
+async def get_async_session(request: Request):
+    # FastAPI caches Security sub-dependencies per scope set, so the auth dependency and the
+    # route would each get their own session; share the first one for the whole request
+    if hasattr(request.state, "db_session"):
+        yield request.state.db_session
+        return
+
+    async with session_scope() as session:
+        request.state.db_session = session
+        yield session
+
+
+def utcnow() -> datetime:
+    """Naive UTC timestamp, as stored in the timestamp columns."""
+    return datetime.now(UTC).replace(tzinfo=None)
+
+
 class UserBase(SQLModel):
     username: str
     email: str | None = None
@@ -25,6 +199,9 @@ class UserBase(SQLModel):
 
 
 class User(UserBase, table=True):
+    # Signup checks for a taken username locally, before Cognito gets to see it
+    __table_args__ = (Index("ix_user_username", "username", unique=True),)
+
     id: int | None = Field(default=None, primary_key=True)
     password: str
     disabled: bool = False
@@ -40,18 +217,68 @@ class UserPublic(UserBase):
     disabled: bool
 
 
+class UserSnapshot(BaseModel):
+    """Immutable copy of the user fields needed to authorize a request, safe to share between requests."""
+
+    model_config = ConfigDict(frozen=True, from_attributes=True)
+
+    id: int
+    username: str
+    email: str | None = None
+    full_name: str | None = None
+    disabled: bool
+
+
 class RandomItemBase(SQLModel):
     min_value: int
     max_value: int
 
 
 class RandomItem(RandomItemBase, table=True):
+    # Serves both the per-user filter and keyset pagination on id
+    # (user_id, num) lets the summary trigger look up a user's new min/max after a delete
+    __table_args__ = (
+        Index("ix_randomitem_user_id_id", "user_id", "id"),
+        Index("ix_randomitem_user_id_num", "user_id", "num"),
+    )
+
     id: int | None = Field(default=None, primary_key=True)
     num: int
     user_id: int | None = Field(default=None, foreign_key="user.id")
     user: User | None = Relationship(back_populates="randomitems")
 
 
+class RandomItemVersion(SQLModel, table=True):
+    """Per-user counter bumped by a trigger whenever any of the user's items change (see migrations)."""
+
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    version: int = Field(default=0, sa_type=BigInteger)
+
+
+class RandomItemSummary(SQLModel, table=True):
+    """Per-user aggregates of RandomItem.num, kept in step by a trigger on randomitem (see migrations)."""
+
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    count: int = Field(default=0, sa_type=BigInteger)
+    sum_num: int = Field(default=0, sa_type=BigInteger)
+    min_num: int | None = None
+    max_num: int | None = None
+
+
+class HistogramBucket(SQLModel):
+    lower: float
+    upper: float
+    count: int
+
+
+class RandomItemStats(SQLModel):
+    count: int
+    min: int | None = None
+    max: int | None = None
+    mean: float | None = None
+    histogram: list[HistogramBucket] | None = None
+
+
 class RandomItemPublic(RandomItemBase):
     id: int
     num: int
@@ -65,9 +292,102 @@ class RandomItemCreate(RandomItemBase):
         return self
 
 
+class RandomItemBatchCreate(RandomItemCreate):
+    count: int = Field(gt=0, le=RANDOMS_MAX_BATCH_SIZE)
+
+
+RandomItemBatch = Annotated[
+    list[RandomItemCreate], PydanticField(min_length=1, max_length=RANDOMS_MAX_BATCH_SIZE)
+]
+
+
 class RandomItemUpdate(RandomItemBase):
     @model_validator(mode="after")
     def check_values(self) -> Self:
         if self.min_value > self.max_value:
             raise ValueError("min value can't be greater than max value")
         return self
+
+
+# The integer columns of randomitem; values outside the range are refused by validation
+# instead of failing in the database
+Int32 = Annotated[int, PydanticField(ge=-(2**31), le=2**31 - 1)]
+
+
+class RandomItemBulkSelect(SQLModel):
+    """Selects a user's items by id and/or by a range of num; at least one criterion is required."""
+
+    ids: list[Int32] | None = Field(default=None, min_length=1, max_length=RANDOMS_MAX_BULK_SIZE)
+    min_num: Int32 | None = None
+    max_num: Int32 | None = None
+
+    @model_validator(mode="after")
+    def check_criteria(self) -> Self:
+        if self.ids is None and self.min_num is None and self.max_num is None:
+            raise ValueError("ids, min_num or max_num is required")
+        return self
+
+
+class RandomItemBulkUpdate(RandomItemBulkSelect):
+    """Re-rolls num of the selected items, within new bounds when min_value and max_value are given."""
+
+    min_value: Int32 | None = None
+    max_value: Int32 | None = None
+
+    @model_validator(mode="after")
+    def check_values(self) -> Self:
+        if (self.min_value is None) != (self.max_value is None):
+            raise ValueError("min value and max value must be given together")
+        if self.min_value is not None and self.min_value > self.max_value:
+            raise ValueError("min value can't be greater than max value")
+        return self
+
+
+class RandomItemBulkResult(SQLModel):
+    affected: int
+
+
+class CognitoOutbox(SQLModel, table=True):
+    """Cognito call written in the same transaction as the local change that needs it.
+
+    Drained by OutboxDispatcher (app/services/outbox.py); `payload` is Fernet encrypted
+    JSON and is cleared once the message is settled.
+    """
+
+    __table_args__ = (
+        Index("ix_cognitooutbox_pending", "next_attempt_at", postgresql_where=text("status = 'pending'")),
+    )
+
+    id: int | None = Field(default=None, primary_key=True)
+    operation: str
+    username: str
+    payload: str | None = None
+    status: str = "pending"
+    attempts: int = 0
+    last_error: str | None = None
+    created_at: datetime = Field(default_factory=utcnow)
+    next_attempt_at: datetime = Field(default_factory=utcnow)
+
+
+class SyncWatermark(SQLModel, table=True):
+    """Progress of an incremental sync job; the row is also locked by the run holding it."""
+
+    name: str = Field(primary_key=True)
+    # Newest change already applied from the remote side, None until the first run completes
+    last_modified: datetime | None = None
+    synced_at: datetime | None = None
+
+
+class IdempotencyKey(SQLModel, table=True):
+    """Idempotency-Key shared by every worker, see DatabaseIdempotencyStore (app/services/idempotency.py)."""
+
+    __table_args__ = (Index("ix_idempotencykey_expires_at", "expires_at"),)
+
+    # sha256 of the Authorization and Idempotency-Key headers
+    key: str = Field(primary_key=True, max_length=64)
+    fingerprint: str
+    # The response, all None while the first request is still running
+    status_code: int | None = None
+    headers: str | None = None
+    body: bytes | None = Field(default=None, sa_type=LargeBinary)
+    expires_at: datetime
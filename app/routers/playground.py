@@ -0,0 +1,73 @@
+import os
+from typing import Annotated, Literal
+
+import numpy as np
+import orjson
+from fastapi import APIRouter, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+
+router = APIRouter()
+
+# Most numbers per request, and numbers generated per chunk when streaming
+RANDOM_MAX_COUNT = int(os.getenv("RANDOM_MAX_COUNT", "10000000"))
+RANDOM_CHUNK_SIZE = int(os.getenv("RANDOM_CHUNK_SIZE", "65536"))
+
+# Per-worker generator for unseeded requests; Generator methods hold the bit generator's
+# lock, so the threads iterating concurrent streams can share it
+rng = np.random.default_rng()
+
+INT64 = np.iinfo(np.int64)
+
+RANDOM_FORMATS = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "binary": "application/octet-stream",
+}
+
+
+def encode_chunk(numbers: np.ndarray, output_format: str, first: bool) -> bytes:
+    if output_format == "binary":
+        return numbers.astype("<i8", copy=False).tobytes()
+    if output_format == "ndjson":
+        return ("\n".join(map(str, numbers.tolist())) + "\n").encode()
+    # Elements of the JSON array streamed between "[" and "]"
+    return (("" if first else ",") + ",".join(map(str, numbers.tolist()))).encode()
+
+
+@router.get("/random", tags=["Random Playground"])
+def generate_randoms(
+    min_value: Annotated[int, Query(alias="min", ge=INT64.min, le=INT64.max)] = 0,
+    max_value: Annotated[int, Query(alias="max", ge=INT64.min, le=INT64.max)] = 100,
+    count: Annotated[int, Query(gt=0, le=RANDOM_MAX_COUNT)] = 1,
+    seed: Annotated[int | None, Query(ge=0)] = None,
+    output_format: Annotated[Literal["json", "ndjson", "binary"], Query(alias="format")] = "json",
+):
+    """Draws `count` integers in [min, max], the same ones every time for a given seed.
+
+    `json` is an array, `ndjson` one number per line and `binary` little endian int64s.
+    Counts above one chunk are generated and sent a chunk at a time.
+    """
+    if min_value > max_value:
+        raise HTTPException(status_code=400, detail="min value can't be greater than max value")
+
+    generator = rng if seed is None else np.random.default_rng(seed)
+    media_type = RANDOM_FORMATS[output_format]
+
+    if count <= RANDOM_CHUNK_SIZE:
+        numbers = generator.integers(min_value, max_value, size=count, endpoint=True)
+        if output_format == "json":
+            return Response(orjson.dumps(numbers, option=orjson.OPT_SERIALIZE_NUMPY), media_type=media_type)
+        return Response(encode_chunk(numbers, output_format, first=True), media_type=media_type)
+
+    # A sync generator, so Starlette runs the generation and encoding in its thread pool
+    def chunks():
+        if output_format == "json":
+            yield b"["
+        for start in range(0, count, RANDOM_CHUNK_SIZE):
+            size = min(RANDOM_CHUNK_SIZE, count - start)
+            numbers = generator.integers(min_value, max_value, size=size, endpoint=True)
+            yield encode_chunk(numbers, output_format, first=start == 0)
+        if output_format == "json":
+            yield b"]"
+
+    return StreamingResponse(chunks(), media_type=media_type)
@@ -1,46 +1,239 @@
 import random
-from typing import Annotated
+from typing import Annotated, Literal
 
-from fastapi import APIRouter, HTTPException, Query, Security
-from sqlmodel import select
+import numpy as np
+import orjson
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response, Security
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import DBAPIError
+from sqlmodel import BigInteger, Float, cast, delete, func, insert, select, update
 
-from app.dependencies import CurrentActiveUser, CurrentActiveUserRandoms, SessionDep, logger
-from app.models import RandomItem, RandomItemCreate, RandomItemPublic, RandomItemUpdate
+from app.core.etags import if_match_digests, item_etag, list_etag, none_match
+from app.core.pagination import decode_cursor, encode_cursor
+from app.dependencies import (
+    RANDOMS_BULK_STATEMENT_TIMEOUT_MS,
+    RANDOMS_EXPORT_FETCH_SIZE,
+    RANDOMS_FAST_JSON,
+    RANDOMS_STATS_MAX_BUCKETS,
+    CurrentActiveUser,
+    CurrentActiveUserRandoms,
+    SessionDep,
+    logger,
+    randoms_cache,
+)
+from app.models import (
+    RANDOMS_MAX_BULK_SIZE,
+    HistogramBucket,
+    RandomItem,
+    RandomItemBatch,
+    RandomItemBatchCreate,
+    RandomItemBulkResult,
+    RandomItemBulkSelect,
+    RandomItemBulkUpdate,
+    RandomItemCreate,
+    RandomItemPublic,
+    RandomItemStats,
+    RandomItemSummary,
+    RandomItemUpdate,
+    RandomItemVersion,
+    stream_partitions,
+)
 
 router = APIRouter()
 
+# Per-worker generator for batch requests, numbers for a whole batch are drawn in one call
+rng = np.random.default_rng()
+
+# RandomItemPublic fields, returned straight from INSERT/UPDATE ... RETURNING
+PUBLIC_COLUMNS = (RandomItem.id, RandomItem.min_value, RandomItem.max_value, RandomItem.num)
+
+# Same digest as item_etag, so If-Match is checked by the UPDATE/DELETE statement itself
+ITEM_DIGEST = func.md5(
+    func.concat_ws(":", RandomItem.id, RandomItem.min_value, RandomItem.max_value, RandomItem.num)
+)
+
 
 @router.get(
     "/randoms/", response_model=list[RandomItemPublic], tags=["Random Items Management"]
 )
 async def read_randoms(
+    request: Request,
+    response: Response,
     session: SessionDep,
     user: CurrentActiveUserRandoms,
     offset: int = 0,
     limit: Annotated[int, Query(le=100)] = 100,
+    cursor: Annotated[str | None, Query(description="next cursor of the previous page")] = None,
+    if_none_match: Annotated[str | None, Header()] = None,
 ):
-    randoms = session.exec(
-        select(RandomItem)
+    # The counter is kept by a trigger on randomitem, one primary key lookup tells whether
+    # anything changed since the client's copy
+    version = (
+        await session.exec(select(RandomItemVersion.version).where(RandomItemVersion.user_id == user.id))
+    ).first() or 0
+    etag = list_etag(user.id, version)
+    if none_match(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    statement = (
+        select(*PUBLIC_COLUMNS)
         .where(RandomItem.user_id == user.id)
-        .offset(offset)
+        .order_by(RandomItem.id)
         .limit(limit)
-    ).all()
+    )
+    # Keyset pagination walks the (user_id, id) index, so deep pages cost the same as the first;
+    # offset is kept for existing clients but has to scan and discard every skipped row
+    if cursor is not None:
+        try:
+            statement = statement.where(RandomItem.id > decode_cursor(cursor))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    else:
+        statement = statement.offset(offset)
+
+    async def load_page():
+        return [row._asdict() for row in (await session.exec(statement)).all()]
+
+    randoms = await randoms_cache.get_or_load(user.id, f"list:{version}:{offset}:{limit}:{cursor}", load_page)
+
+    headers = {"ETag": etag}
+    if randoms and len(randoms) == limit:
+        next_cursor = encode_cursor(randoms[-1]["id"])
+        next_url = request.url.remove_query_params("offset").include_query_params(cursor=next_cursor)
+        headers["X-Next-Cursor"] = next_cursor
+        headers["Link"] = f'<{next_url}>; rel="next"'
+
+    # The fast path encodes the rows with orjson, skipping the response_model validation
+    # of rows that come straight from our own table
+    if RANDOMS_FAST_JSON:
+        return Response(orjson.dumps(randoms), media_type="application/json", headers=headers)
+    response.headers.update(headers)
     return randoms
 
 
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "", '{{"id":{},"min_value":{},"max_value":{},"num":{}}}\n'),
+    "csv": ("text/csv", "id,min_value,max_value,num\n", "{},{},{},{}\n"),
+}
+
+
+# Declared before /randoms/{random_id} so "export" isn't parsed as an id
+@router.get("/randoms/export", tags=["Random Items Management"])
+async def export_randoms(
+    request: Request,
+    session: SessionDep,
+    user: CurrentActiveUserRandoms,
+    export_format: Annotated[Literal["ndjson", "csv"], Query(alias="format")] = "ndjson",
+):
+    """Streams every item of the user; memory use doesn't grow with the number of rows."""
+    # Yield dependencies exit only after the response is sent, so the request session (left
+    # in a transaction by the user lookup) would hold its connection for the whole export
+    # on top of the one streaming the rows; hand it back first
+    await session.close()
+    media_type, header, row_format = EXPORT_FORMATS[export_format]
+    statement = (
+        select(*PUBLIC_COLUMNS)
+        .where(RandomItem.user_id == user.id)
+        .order_by(RandomItem.id)
+    )
+
+    async def chunks():
+        if header:
+            yield header.encode()
+        async for rows in stream_partitions(statement, RANDOMS_EXPORT_FETCH_SIZE):
+            if await request.is_disconnected():
+                logger.info("Client disconnected, stopping export...")
+                return
+            yield "".join(row_format.format(*row) for row in rows).encode()
+
+    return StreamingResponse(
+        chunks(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="randoms.{export_format}"'},
+    )
+
+
+# Declared before /randoms/{random_id} so "stats" isn't parsed as an id
+@router.get("/randoms/stats", response_model=RandomItemStats, tags=["Random Items Management"])
+async def read_randoms_stats(
+    session: SessionDep,
+    user: CurrentActiveUserRandoms,
+    buckets: Annotated[int, Query(ge=0, le=RANDOMS_STATS_MAX_BUCKETS, description="histogram buckets, 0 for none")] = 0,
+    bucket_min: Annotated[int | None, Query(description="lowest num in the histogram, defaults to the min")] = None,
+    bucket_max: Annotated[int | None, Query(description="highest num in the histogram, defaults to the max")] = None,
+):
+    """Summary of the user's items; count, min, max and mean come from one summary row whatever the item count."""
+    summary = (
+        await session.exec(select(RandomItemSummary).where(RandomItemSummary.user_id == user.id))
+    ).first()
+    if summary is None or summary.count == 0:
+        return RandomItemStats(count=0, histogram=[] if buckets else None)
+
+    stats = RandomItemStats(
+        count=summary.count,
+        min=summary.min_num,
+        max=summary.max_num,
+        mean=summary.sum_num / summary.count,
+    )
+    if not buckets:
+        return stats
+
+    low = summary.min_num if bucket_min is None else bucket_min
+    high = summary.max_num if bucket_max is None else bucket_max
+    if low > high:
+        raise HTTPException(status_code=400, detail="bucket_min can't be greater than bucket_max")
+
+    # Buckets split [low, high + 1) evenly so every integer in [low, high] falls in one of them;
+    # the counting is done by the database in a single pass over the user's items
+    bucket = func.width_bucket(cast(RandomItem.num, Float), cast(low, Float), cast(high + 1, Float), buckets)
+    counts = dict(
+        (
+            await session.exec(
+                select(bucket, func.count())
+                .where(RandomItem.user_id == user.id)
+                .where(RandomItem.num.between(low, high))
+                .group_by(bucket)
+            )
+        ).all()
+    )
+    width = (high + 1 - low) / buckets
+    stats.histogram = [
+        HistogramBucket(lower=low + i * width, upper=low + (i + 1) * width, count=counts.get(i + 1, 0))
+        for i in range(buckets)
+    ]
+    return stats
+
+
 @router.get(
     "/randoms/{random_id}",
     response_model=RandomItemPublic,
     tags=["Random Items Management"],
 )
-async def read_random(random_id: int, session: SessionDep, user: CurrentActiveUserRandoms):
-    random_db = session.exec(
-        select(RandomItem)
-        .where(RandomItem.user_id == user.id)
-        .where(RandomItem.id == random_id)
-    ).first()
+async def read_random(
+    random_id: int,
+    response: Response,
+    session: SessionDep,
+    user: CurrentActiveUserRandoms,
+    if_none_match: Annotated[str | None, Header()] = None,
+):
+    async def load_item():
+        row = (
+            await session.exec(
+                select(*PUBLIC_COLUMNS)
+                .where(RandomItem.user_id == user.id)
+                .where(RandomItem.id == random_id)
+            )
+        ).first()
+        return row._asdict() if row else None
+
+    random_db = await randoms_cache.get_or_load(user.id, f"item:{random_id}", load_item)
     if not random_db:
         raise HTTPException(status_code=404, detail="Random Item not found")
+
+    etag = item_etag(random_db)
+    if none_match(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
     return random_db
 
 
@@ -50,18 +243,162 @@ async def read_random(random_id: int, session: SessionDep, user: CurrentActiveUs
 async def create_random(
     item: RandomItemCreate, session: SessionDep, user: CurrentActiveUserRandoms
 ):
-    # NOTE: We use update here to set the num attribute dynamically which is a field in RandomItem but not in RandomItemCreate to solve pydantic missing attribute error
-    new_item = RandomItem.model_validate(
-        item, update={"num": random.randint(item.min_value, item.max_value)}
+    # A single INSERT ... RETURNING instead of an INSERT followed by a refresh SELECT
+    result = await session.execute(
+        insert(RandomItem)
+        .values(
+            min_value=item.min_value,
+            max_value=item.max_value,
+            num=random.randint(item.min_value, item.max_value),
+            user_id=user.id,
+        )
+        .returning(*PUBLIC_COLUMNS)
     )
-    new_item.user = user
-    session.add(new_item)
-    session.commit()
-    session.refresh(new_item)
+    new_item = result.mappings().one()
+    await session.commit()
+    await randoms_cache.invalidate(user.id)
     logger.info("Created new random...")
     return new_item
 
 
+@router.post(
+    "/randoms/batch",
+    response_model=list[RandomItemPublic],
+    tags=["Random Items Management"],
+)
+async def create_randoms_batch(
+    items: RandomItemBatch | RandomItemBatchCreate,
+    session: SessionDep,
+    user: CurrentActiveUserRandoms,
+):
+    """Creates up to RANDOMS_MAX_BATCH_SIZE items from a list of ranges, or `count` items from one range."""
+    if isinstance(items, RandomItemBatchCreate):
+        min_values = np.full(items.count, items.min_value, dtype=np.int64)
+        max_values = np.full(items.count, items.max_value, dtype=np.int64)
+    else:
+        min_values = np.fromiter((item.min_value for item in items), dtype=np.int64, count=len(items))
+        max_values = np.fromiter((item.max_value for item in items), dtype=np.int64, count=len(items))
+    nums = rng.integers(min_values, max_values, endpoint=True)
+
+    rows = [
+        {"min_value": min_value, "max_value": max_value, "num": num, "user_id": user.id}
+        for min_value, max_value, num in zip(
+            min_values.tolist(), max_values.tolist(), nums.tolist(), strict=True
+        )
+    ]
+    # Sent as multi-row INSERT ... RETURNING statements in a single transaction
+    result = await session.execute(
+        insert(RandomItem).returning(*PUBLIC_COLUMNS, sort_by_parameter_order=True),
+        rows,
+    )
+    new_items = result.mappings().all()
+    await session.commit()
+    await randoms_cache.invalidate(user.id)
+    logger.info(f"Created {len(new_items)} new randoms...")
+    return new_items
+
+
+def with_bulk_selection(statement, selection: RandomItemBulkSelect, user_id: int):
+    """Scopes a bulk UPDATE/DELETE to the user's items matching `selection`.
+
+    A selection by num range alone is limited to RANDOMS_MAX_BULK_SIZE + 1 rows, so run_bulk
+    can refuse it once it matches more than RANDOMS_MAX_BULK_SIZE.
+    """
+    conditions = [RandomItem.user_id == user_id]
+    if selection.ids is not None:
+        conditions.append(RandomItem.id.in_(selection.ids))
+    if selection.min_num is not None:
+        conditions.append(RandomItem.num >= selection.min_num)
+    if selection.max_num is not None:
+        conditions.append(RandomItem.num <= selection.max_num)
+
+    if selection.ids is None:
+        matching = select(RandomItem.id).where(*conditions).limit(RANDOMS_MAX_BULK_SIZE + 1)
+        conditions = [RandomItem.user_id == user_id, RandomItem.id.in_(matching)]
+    statement = statement.where(*conditions)
+    return statement.execution_options(synchronize_session=False)
+
+
+async def run_bulk(session, statement) -> int:
+    """Runs one set based statement under RANDOMS_BULK_STATEMENT_TIMEOUT_MS and returns the affected row count."""
+    # set_config(..., true) is SET LOCAL, the timeout ends with this transaction
+    await session.exec(
+        select(func.set_config("statement_timeout", str(RANDOMS_BULK_STATEMENT_TIMEOUT_MS), True))
+    )
+    try:
+        result = await session.execute(statement)
+    except DBAPIError as e:
+        # 57014 is query_canceled, raised when the statement timeout expires
+        if getattr(e.orig, "pgcode", None) == "57014":
+            raise HTTPException(status_code=503, detail="Bulk operation timed out, select fewer items")
+        raise
+    if result.rowcount > RANDOMS_MAX_BULK_SIZE:
+        await session.rollback()
+        raise HTTPException(
+            status_code=422, detail=f"Selection matches more than {RANDOMS_MAX_BULK_SIZE} items, narrow it down"
+        )
+    await session.commit()
+    return result.rowcount
+
+
+# Declared before /randoms/{random_id} so "bulk" isn't parsed as an id
+@router.patch("/randoms/bulk", response_model=RandomItemBulkResult, tags=["Random Items Management"])
+async def update_randoms_bulk(
+    selection: RandomItemBulkUpdate, session: SessionDep, user: CurrentActiveUserRandoms
+):
+    """Re-rolls num of every selected item in one UPDATE, drawing it in the database."""
+    if selection.min_value is None:
+        min_value, max_value = RandomItem.min_value, RandomItem.max_value
+        values = {}
+    else:
+        min_value, max_value = selection.min_value, selection.max_value
+        values = {"min_value": min_value, "max_value": max_value}
+    # In bigint, max - min + 1 overflows integer for the widest valid ranges
+    min_value, max_value = cast(min_value, BigInteger), cast(max_value, BigInteger)
+    values["num"] = min_value + cast(func.floor(func.random() * (max_value - min_value + 1)), BigInteger)
+
+    affected = await run_bulk(session, with_bulk_selection(update(RandomItem).values(**values), selection, user.id))
+    if affected:
+        await randoms_cache.invalidate(user.id)
+    logger.info(f"Re-rolled {affected} randoms...")
+    return RandomItemBulkResult(affected=affected)
+
+
+@router.delete("/randoms/bulk", response_model=RandomItemBulkResult, tags=["Random Items Management"])
+async def delete_randoms_bulk(
+    selection: Annotated[RandomItemBulkSelect, Query()], session: SessionDep, user: CurrentActiveUserRandoms
+):
+    """Deletes every selected item in one DELETE, selected by query parameters (?ids=1&ids=2 or ?min_num=&max_num=)."""
+    affected = await run_bulk(session, with_bulk_selection(delete(RandomItem), selection, user.id))
+    if affected:
+        await randoms_cache.invalidate(user.id)
+    logger.info(f"Deleted {affected} randoms...")
+    return RandomItemBulkResult(affected=affected)
+
+
+def with_if_match(statement, if_match: str | None):
+    """Restricts an UPDATE/DELETE of one item to the versions listed in If-Match."""
+    if if_match is None:
+        return statement
+    digests = if_match_digests(if_match)
+    if digests is None:
+        return statement
+    return statement.where(ITEM_DIGEST.in_(digests))
+
+
+async def raise_not_found_or_precondition_failed(session, user_id: int, random_id: int, if_match: str | None):
+    """Tells apart a missing item from one that changed since the client's If-Match, once no row matched."""
+    if if_match is not None:
+        exists = (
+            await session.exec(
+                select(RandomItem.id).where(RandomItem.user_id == user_id).where(RandomItem.id == random_id)
+            )
+        ).first()
+        if exists is not None:
+            raise HTTPException(status_code=412, detail="Random item has changed")
+    raise HTTPException(status_code=404, detail="Random item not found")
+
+
 @router.patch(
     "/randoms/{random_id}",
     response_model=RandomItemPublic,
@@ -70,42 +407,52 @@ async def create_random(
 async def update_random(
     random_id: int,
     random_item: RandomItemUpdate,
+    response: Response,
     session: SessionDep,
     user: CurrentActiveUserRandoms,
+    if_match: Annotated[str | None, Header()] = None,
 ):
-    random_db = session.exec(
-        select(RandomItem)
-        .where(RandomItem.user_id == user.id)
-        .where(RandomItem.id == random_id)
-    ).first()
-    if not random_db:
-        raise HTTPException(status_code=404, detail="Random item not found")
-
     random_data = random_item.model_dump(exclude_unset=True)
     logger.info(f"DATA IN PATCH: {random_data}")
-    random_db.sqlmodel_update(
-        random_data,
-        update={
-            "num": random.randint(
-                random_data.get("min_value"), random_data.get("max_value")
-            )
-        },
+    # One UPDATE ... RETURNING, a missing or foreign item simply matches no row
+    statement = (
+        update(RandomItem)
+        .where(RandomItem.user_id == user.id)
+        .where(RandomItem.id == random_id)
+        .values(
+            **random_data,
+            num=random.randint(random_data.get("min_value"), random_data.get("max_value")),
+        )
+        .returning(*PUBLIC_COLUMNS)
+        .execution_options(synchronize_session=False)
     )
-    session.add(random_db)
-    session.commit()
-    session.refresh(random_db)
+    result = await session.execute(with_if_match(statement, if_match))
+    random_db = result.mappings().first()
+    if not random_db:
+        await raise_not_found_or_precondition_failed(session, user.id, random_id, if_match)
+    await session.commit()
+    await randoms_cache.invalidate(user.id)
+    response.headers["ETag"] = item_etag(random_db)
     return random_db
 
 
 @router.delete("/randoms/{random_id}", tags=["Random Items Management"])
-async def delete_random(random_id: int, session: SessionDep, user: CurrentActiveUserRandoms):
-    random_db = session.exec(
-        select(RandomItem)
+async def delete_random(
+    random_id: int,
+    session: SessionDep,
+    user: CurrentActiveUserRandoms,
+    if_match: Annotated[str | None, Header()] = None,
+):
+    statement = (
+        delete(RandomItem)
         .where(RandomItem.user_id == user.id)
         .where(RandomItem.id == random_id)
-    ).first()
-    if not random_db:
-        raise HTTPException(status_code=404, detail="Random item not found")
-    session.delete(random_db)
-    session.commit()
+        .returning(RandomItem.id)
+        .execution_options(synchronize_session=False)
+    )
+    result = await session.execute(with_if_match(statement, if_match))
+    if result.first() is None:
+        await raise_not_found_or_precondition_failed(session, user.id, random_id, if_match)
+    await session.commit()
+    await randoms_cache.invalidate(user.id)
     return {"ok": True}
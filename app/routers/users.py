@@ -1,50 +1,66 @@
 import json
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, Security
+from fastapi import APIRouter, Depends, HTTPException, Security
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
 
-from app.core.aws_cognito import AWSCognito, UserSignin, UserSignup, UserVerify
+from app.core.aws_cognito import AsyncAWSCognito, UserSignin, UserSignup, UserVerify
 from app.dependencies import (
     CurrentActiveUser,
     SessionDep,
     Token,
     TokenDep,
-    get_aws_cognito,
+    get_async_aws_cognito,
     get_password_hash,
     logger,
+    user_cache,
 )
-from app.models import User, UserPublic
+from app.models import CognitoOutbox, User, UserPublic
 from app.services.cognito import AuthService
+from app.services.outbox import (
+    PENDING,
+    SIGN_UP,
+    resend_confirmation_code_message,
+    signup_message,
+)
 
 router = APIRouter()
 
 
-@router.post("/users/signup", tags=["Authentication"])
-async def create_users(
-    user: UserSignup,
-    session: SessionDep,
-    cognito: AWSCognito = Depends(get_aws_cognito),
-):
-    resp = AuthService.user_signup(user, cognito)
+@router.post("/users/signup", status_code=202, tags=["Authentication"])
+async def create_users(user: UserSignup, session: SessionDep):
+    # The Cognito sign up happens later through the outbox, so taken usernames are refused here
+    if (await session.exec(select(User.id).where(User.username == user.username))).first() is not None:
+        raise HTTPException(status_code=409, detail="account with username exists")
+    # Hand the connection back while the password waits for a hashing thread, so a burst of
+    # signups doesn't hold the pool that other requests need
+    await session.rollback()
+
     db_user = User(
         username=user.username,
         email=user.email,
-        password=get_password_hash(user.password),
+        password=await get_password_hash(user.password),
     )
+    # The user and its Cognito sign up commit or fail together
     session.add(db_user)
-    session.commit()
-    session.refresh(db_user)
+    session.add(signup_message(user))
+    try:
+        await session.commit()
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="account with username exists")
+    user_cache.delete(user.username)
 
-    return resp
+    return {"message": "Signup accepted, a confirmation code will be sent by email"}
 
 
 @router.post("/users/login", tags=["Authentication"])
 async def login(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-    cognito: AWSCognito = Depends(get_aws_cognito),
+    cognito: AsyncAWSCognito = Depends(get_async_aws_cognito),
 ) -> Token:
-    resp = AuthService.user_signin(
+    resp = await AuthService.user_signin(
         UserSignin(username=form_data.username, password=form_data.password), cognito
     )
     content = json.loads(resp.body.decode("utf-8"))
@@ -53,13 +69,29 @@ async def login(
 
 
 @router.post("/users/verify", tags=["Authentication"])
-async def verify(data: UserVerify, cognito: AWSCognito = Depends(get_aws_cognito)):
-    return AuthService.verify_account(data, cognito)
+async def verify(data: UserVerify, cognito: AsyncAWSCognito = Depends(get_async_aws_cognito)):
+    return await AuthService.verify_account(data, cognito)
+
+
+@router.post("/users/resend_confirmation_code", status_code=202, tags=["Authentication"])
+async def resend_code(username: str, session: SessionDep):
+    if (await session.exec(select(User.id).where(User.username == username))).first() is None:
+        raise HTTPException(status_code=404, detail="User not found")
 
+    # A sign up still in the outbox sends the first code itself
+    pending_signup = (
+        await session.exec(
+            select(CognitoOutbox.id)
+            .where(CognitoOutbox.username == username)
+            .where(CognitoOutbox.operation == SIGN_UP)
+            .where(CognitoOutbox.status == PENDING)
+        )
+    ).first()
+    if pending_signup is None:
+        session.add(resend_confirmation_code_message(username))
+        await session.commit()
 
-@router.post("/users/resend_confirmation_code", tags=["Authentication"])
-async def resend_code(username: str, cognito: AWSCognito = Depends(get_aws_cognito)):
-    return AuthService.resend_confirmation(username, cognito)
+    return {"message": "A confirmation code will be sent by email"}
 
 
 @router.get("/users/me", response_model=UserPublic, tags=["Authentication"])
@@ -72,6 +104,6 @@ async def read_users_me(current_user: CurrentActiveUser):
 @router.get("/users/logout", tags=["Authentication"])
 async def logout(
     token: TokenDep,
-    cognito: AWSCognito = Depends(get_aws_cognito),
+    cognito: AsyncAWSCognito = Depends(get_async_aws_cognito),
 ):
-    return AuthService.logout(token, cognito)
+    return await AuthService.logout(token, cognito)
@@ -2,33 +2,15 @@ from botocore.exceptions import ClientError
 from fastapi import HTTPException
 from fastapi.responses import JSONResponse
 
-from app.core.aws_cognito import AWSCognito, UserSignin, UserSignup, UserVerify
-from app.dependencies import logger
+from app.core.aws_cognito import AsyncAWSCognito, UserSignin, UserVerify
+from app.dependencies import logger, token_cache
 
 
 class AuthService:
     @staticmethod
-    def user_signup(user: UserSignup, cognito: AWSCognito):
+    async def user_signin(user: UserSignin, cognito: AsyncAWSCognito):
         try:
-            response = cognito.user_signup(user)
-        except ClientError as e:
-            logger.info(f"ERROR FROM COGNNITO: {e}")
-            if e.response["Error"]["Code"] == "UsernameExistsException":
-                raise HTTPException(status_code=409, detail="account with email exists")
-            else:
-                raise HTTPException(status_code=500, detail="Internal server error")
-        else:
-            if response["ResponseMetadata"]["HTTPStatusCode"] == 200:
-                content = {
-                    "message": "User created successfully",
-                    "sub": response["UserSub"],
-                }
-                return JSONResponse(content=content, status_code=201)
-
-    @staticmethod
-    def user_signin(user: UserSignin, cognito: AWSCognito):
-        try:
-            response = cognito.user_signin(user)
+            response = await cognito.user_signin(user)
         except ClientError as e:
             logger.info(f"ERROR USER SIGNIN - {e}")
             if e.response["Error"]["Code"] == "UserNotFoundException":
@@ -51,9 +33,11 @@ class AuthService:
             return JSONResponse(content, status_code=200)
 
     @staticmethod
-    def logout(access_token: str, cognito: AWSCognito):
+    async def logout(access_token: str, cognito: AsyncAWSCognito):
+        # Stop accepting the token in this worker right away, whatever Cognito answers
+        token_cache.revoke(access_token)
         try:
-            cognito.logout(access_token)
+            await cognito.logout(access_token)
         except ClientError as e:
             if e.response["Error"]["Code"] == "InvalidParameterException":
                 raise HTTPException(
@@ -73,9 +57,9 @@ class AuthService:
             )
 
     @staticmethod
-    def verify_account(data: UserVerify, cognito: AWSCognito):
+    async def verify_account(data: UserVerify, cognito: AsyncAWSCognito):
         try:
-            cognito.verify_account(data)
+            await cognito.verify_account(data)
         except ClientError as e:
             if e.response["Error"]["Code"] == "CodeMismatchException":
                 raise HTTPException(
@@ -96,20 +80,3 @@ class AuthService:
             return JSONResponse(
                 content={"message": "Account verification successful"}, status_code=200
             )
-
-    @staticmethod
-    def resend_confirmation(username: str, cognito: AWSCognito):
-        try:
-            cognito.resend_confirmation_code(username)
-        except ClientError as e:
-            if e.response["Error"]["Code"] == "UserNotFoundException":
-                raise HTTPException(status_code=404, detail="User not found")
-            elif e.response["Error"]["Code"] == "LimitExceededException":
-                raise HTTPException(status_code=429, detail="Limit exceeded")
-            else:
-                raise HTTPException(status_code=500, detail="Internal Server")
-        else:
-            return JSONResponse(
-                content={"message": "Confirmation code sent successfully"},
-                status_code=200,
-            )
@@ -0,0 +1,116 @@
+import asyncio
+import json
+import time
+from datetime import timedelta
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import delete, select, update
+
+from app.core.idempotency import IdempotencyRecord, StoredResponse
+from app.models import IdempotencyKey, session_scope, utcnow
+
+
+class DatabaseIdempotencyStore:
+    """IdempotencyStore in the idempotencykey table, so retries are deduplicated on every worker.
+
+    A key held by a running request expires after `lease` seconds, so a worker dying mid-request
+    doesn't block retries for the whole `ttl`. Duplicates wait by polling the row every
+    `poll_interval` seconds.
+    """
+
+    def __init__(self, ttl: float = 24 * 60 * 60, lease: float = 60, poll_interval: float = 0.25):
+        self.ttl = ttl
+        self.lease = lease
+        self.poll_interval = poll_interval
+
+    async def reserve(self, key: str, fingerprint: str) -> IdempotencyRecord | None:
+        while True:
+            now = utcnow()
+            statement = insert(IdempotencyKey).values(
+                key=key, fingerprint=fingerprint, expires_at=now + timedelta(seconds=self.lease)
+            )
+            excluded = statement.excluded
+            statement = statement.on_conflict_do_update(
+                index_elements=[IdempotencyKey.key],
+                set_={
+                    "fingerprint": excluded.fingerprint,
+                    "status_code": None,
+                    "headers": None,
+                    "body": None,
+                    "expires_at": excluded.expires_at,
+                },
+                # An expired key is taken over, a live one is left to its holder
+                where=IdempotencyKey.expires_at <= now,
+            ).returning(IdempotencyKey.key)
+
+            async with session_scope() as session:
+                if (await session.execute(statement)).first() is not None:
+                    await session.commit()
+                    return None
+                row = (await session.exec(select(IdempotencyKey).where(IdempotencyKey.key == key))).first()
+                record = None if row is None else self._to_record(row)
+                await session.commit()
+            # Otherwise the holder released it in between, so try to claim it again
+            if record is not None:
+                return record
+
+    async def wait(self, key: str, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while True:
+            async with session_scope() as session:
+                row = (
+                    await session.execute(
+                        select(IdempotencyKey.status_code, IdempotencyKey.expires_at).where(IdempotencyKey.key == key)
+                    )
+                ).first()
+            if row is None or row.status_code is not None or row.expires_at <= utcnow():
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            await asyncio.sleep(min(self.poll_interval, remaining))
+
+    async def complete(self, key: str, response: StoredResponse):
+        headers = json.dumps([[name.decode("latin-1"), value.decode("latin-1")] for name, value in response.headers])
+        async with session_scope() as session:
+            await session.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.key == key)
+                .values(
+                    status_code=response.status_code,
+                    headers=headers,
+                    body=response.body,
+                    expires_at=utcnow() + timedelta(seconds=self.ttl),
+                )
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+
+    async def release(self, key: str):
+        async with session_scope() as session:
+            await session.execute(
+                delete(IdempotencyKey)
+                .where(IdempotencyKey.key == key)
+                .where(IdempotencyKey.status_code.is_(None))
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+
+    async def purge(self) -> int:
+        async with session_scope() as session:
+            result = await session.execute(
+                delete(IdempotencyKey)
+                .where(IdempotencyKey.expires_at <= utcnow())
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+        return result.rowcount
+
+    @staticmethod
+    def _to_record(row: IdempotencyKey) -> IdempotencyRecord:
+        response = None
+        if row.status_code is not None:
+            headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in json.loads(row.headers)]
+            response = StoredResponse(row.status_code, headers, row.body)
+        expires_in = (row.expires_at - utcnow()).total_seconds()
+        return IdempotencyRecord(row.fingerprint, time.monotonic() + expires_in, response)
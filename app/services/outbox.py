@@ -0,0 +1,254 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import random
+import time
+from datetime import timedelta
+from functools import lru_cache
+
+from botocore.exceptions import BotoCoreError, ClientError
+from sqlmodel import delete, func, select, update
+
+from app.core.aws_cognito import AsyncAWSCognito, UserSignup
+from app.core.executors import ExecutorSaturated
+from app.core.metrics import OUTBOX_DRAIN_LATENCY, OUTBOX_MESSAGES, OUTBOX_PENDING
+from app.dependencies import SECRET_KEY, logger, user_cache
+from app.models import CognitoOutbox, User, session_scope, utcnow
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "25"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF = float(os.getenv("OUTBOX_BACKOFF", "2"))
+OUTBOX_MAX_BACKOFF = float(os.getenv("OUTBOX_MAX_BACKOFF", "300"))
+# Seconds a claimed message stays invisible to other workers; longer than the slowest Cognito
+# call including botocore's retries
+OUTBOX_LEASE = float(os.getenv("OUTBOX_LEASE", "120"))
+# Done and failed messages are kept this many seconds, checked every OUTBOX_PURGE_INTERVAL
+OUTBOX_RETENTION = float(os.getenv("OUTBOX_RETENTION", str(7 * 24 * 60 * 60)))
+OUTBOX_PURGE_INTERVAL = float(os.getenv("OUTBOX_PURGE_INTERVAL", "3600"))
+
+SIGN_UP = "sign_up"
+RESEND_CONFIRMATION_CODE = "resend_confirmation_code"
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+# Worth retrying later; any other Cognito error fails the same way on every attempt
+RETRYABLE_ERRORS = {
+    "TooManyRequestsException",
+    "LimitExceededException",
+    "InternalErrorException",
+    "ThrottlingException",
+}
+
+
+@lru_cache
+def get_fernet():
+    from cryptography.fernet import Fernet
+
+    # Signup payloads hold the password until Cognito has it, so they are encrypted at rest
+    return Fernet(base64.urlsafe_b64encode(hashlib.sha256(SECRET_KEY.encode()).digest()))
+
+
+def signup_message(user: UserSignup) -> CognitoOutbox:
+    payload = json.dumps({"email": user.email, "password": user.password})
+    return CognitoOutbox(
+        operation=SIGN_UP, username=user.username, payload=get_fernet().encrypt(payload.encode()).decode()
+    )
+
+
+def resend_confirmation_code_message(username: str) -> CognitoOutbox:
+    return CognitoOutbox(operation=RESEND_CONFIRMATION_CODE, username=username)
+
+
+def error_code(error: Exception) -> str | None:
+    if isinstance(error, ClientError):
+        return error.response["Error"]["Code"]
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, ClientError):
+        return error_code(error) in RETRYABLE_ERRORS
+    return isinstance(error, (BotoCoreError, ExecutorSaturated))
+
+
+class OutboxDispatcher:
+    """Sends pending CognitoOutbox messages to Cognito in batches.
+
+    Every worker runs one. A batch is claimed in a short transaction that leases its rows
+    (pushes next_attempt_at out by `lease` seconds), Cognito is called with no transaction
+    or connection held, and the outcomes are written in a second short transaction. A worker
+    dying mid-batch leaves its messages to be retried once the lease runs out. Retryable
+    failures are tried again after an exponential backoff with jitter, others (and messages
+    out of attempts) are marked failed; a failed sign up deletes its local user in the same
+    transaction. Settled messages are deleted after `retention` seconds.
+    """
+
+    def __init__(
+        self,
+        cognito: AsyncAWSCognito,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        poll_interval: float = OUTBOX_POLL_INTERVAL,
+        max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+        backoff: float = OUTBOX_BACKOFF,
+        max_backoff: float = OUTBOX_MAX_BACKOFF,
+        lease: float = OUTBOX_LEASE,
+        retention: float = OUTBOX_RETENTION,
+        purge_interval: float = OUTBOX_PURGE_INTERVAL,
+    ):
+        self.cognito = cognito
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lease = lease
+        self.retention = retention
+        self.purge_interval = purge_interval
+
+    async def run(self):
+        next_purge = time.monotonic() + self.purge_interval
+        while True:
+            try:
+                dispatched = await self.dispatch_batch()
+                if time.monotonic() >= next_purge:
+                    next_purge = time.monotonic() + self.purge_interval
+                    purged = await self.purge()
+                    if purged:
+                        logger.info(f"Purged {purged} settled Cognito outbox messages")
+            except Exception as e:
+                logger.warning(f"Unable to dispatch the Cognito outbox: {e}")
+                dispatched = 0
+            # A full batch means there is probably more waiting
+            if dispatched < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+    async def dispatch_batch(self) -> int:
+        messages = await self._claim()
+        if messages:
+            outcomes = await asyncio.gather(*(self._dispatch(message) for message in messages))
+            await self._record(messages, outcomes)
+        return len(messages)
+
+    async def purge(self, batch_size: int = 1000) -> int:
+        """Deletes messages settled more than `retention` seconds ago, `batch_size` rows per statement."""
+        cutoff = utcnow() - timedelta(seconds=self.retention)
+        settled = (
+            select(CognitoOutbox.id)
+            .where(CognitoOutbox.status.in_((DONE, FAILED)))
+            .where(CognitoOutbox.created_at < cutoff)
+            .limit(batch_size)
+        )
+        purged = 0
+        async with session_scope() as session:
+            while True:
+                result = await session.execute(
+                    delete(CognitoOutbox)
+                    .where(CognitoOutbox.id.in_(settled))
+                    .execution_options(synchronize_session=False)
+                )
+                await session.commit()
+                purged += result.rowcount
+                if result.rowcount < batch_size:
+                    return purged
+
+    def backoff_delay(self, attempts: int) -> float:
+        return min(self.max_backoff, self.backoff * 2 ** (attempts - 1)) * random.uniform(0.5, 1)
+
+    async def _claim(self) -> list:
+        now = utcnow()
+        claimable = (
+            select(CognitoOutbox.id)
+            .where(CognitoOutbox.status == PENDING)
+            .where(CognitoOutbox.next_attempt_at <= now)
+            .order_by(CognitoOutbox.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        async with session_scope() as session:
+            messages = (
+                await session.execute(
+                    update(CognitoOutbox)
+                    .where(CognitoOutbox.id.in_(claimable))
+                    # Counted when claimed, so a message whose worker died mid-call (maybe after
+                    # Cognito took it) is known to have been attempted when it is claimed again
+                    .values(next_attempt_at=now + timedelta(seconds=self.lease), attempts=CognitoOutbox.attempts + 1)
+                    .returning(
+                        CognitoOutbox.id,
+                        CognitoOutbox.operation,
+                        CognitoOutbox.username,
+                        CognitoOutbox.payload,
+                        CognitoOutbox.attempts,
+                        CognitoOutbox.created_at,
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+            ).all()
+            pending = (
+                await session.exec(
+                    select(func.count()).select_from(CognitoOutbox).where(CognitoOutbox.status == PENDING)
+                )
+            ).one()
+            await session.commit()
+        OUTBOX_PENDING.set(pending)
+        return messages
+
+    async def _record(self, messages: list, outcomes: list[dict]):
+        abandoned = []
+        async with session_scope() as session:
+            for message, values in zip(messages, outcomes, strict=True):
+                await session.execute(
+                    update(CognitoOutbox)
+                    .where(CognitoOutbox.id == message.id)
+                    .values(**values)
+                    .execution_options(synchronize_session=False)
+                )
+                if message.operation == SIGN_UP and values.get("status") == FAILED:
+                    abandoned.append(message.username)
+            if abandoned:
+                # Cognito never got these accounts, so the local users could neither log in nor
+                # sign up again; dropping them with the failed message frees the username
+                await session.execute(
+                    delete(User).where(User.username.in_(abandoned)).execution_options(synchronize_session=False)
+                )
+            await session.commit()
+        for username in abandoned:
+            user_cache.delete(username)
+
+    async def _dispatch(self, message) -> dict:
+        """Sends one claimed message and returns the column values recording the outcome."""
+        try:
+            if message.operation == SIGN_UP:
+                payload = json.loads(get_fernet().decrypt(message.payload.encode()))
+                await self.cognito.user_signup(UserSignup(username=message.username, **payload))
+            elif message.operation == RESEND_CONFIRMATION_CODE:
+                await self.cognito.resend_confirmation_code(message.username)
+            else:
+                raise ValueError(f"Unknown outbox operation {message.operation}")
+        except Exception as e:
+            # Already counting this attempt, see _claim
+            attempts = message.attempts
+            values = {"last_error": str(e)[:1000]}
+            if message.operation == SIGN_UP and attempts > 1 and error_code(e) == "UsernameExistsException":
+                # An earlier attempt, failed in transit or cut short with its worker, most likely went through
+                values.update(status=DONE, payload=None)
+                outcome = "done"
+            elif is_retryable(e) and attempts < self.max_attempts:
+                values["next_attempt_at"] = utcnow() + timedelta(seconds=self.backoff_delay(attempts))
+                outcome = "retry"
+            else:
+                values.update(status=FAILED, payload=None)
+                outcome = "failed"
+                logger.error(f"Giving up on {message.operation} for {message.username}: {e}")
+        else:
+            values = {"status": DONE, "payload": None}
+            outcome = "done"
+            OUTBOX_DRAIN_LATENCY.labels(message.operation).observe(
+                (utcnow() - message.created_at).total_seconds()
+            )
+        OUTBOX_MESSAGES.labels(message.operation, outcome).inc()
+        return values
@@ -0,0 +1,316 @@
+"""Reconciles the user table with the Cognito user pool.
+
+Run once with `python -m app.services.reconcile`, or every USER_RECONCILE_INTERVAL seconds
+from the app's lifespan.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+from typing import Protocol
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import false, func, or_, select, update
+
+from app.core.aws_cognito import AsyncAWSCognito
+from app.core.metrics import USER_RECONCILE_CHANGES, USER_RECONCILE_LATENCY
+from app.dependencies import get_async_aws_cognito, logger, user_cache
+from app.models import (
+    CognitoOutbox,
+    SyncWatermark,
+    User,
+    async_engine,
+    session_scope,
+    stream_partitions,
+    utcnow,
+)
+from app.services.outbox import PENDING, SIGN_UP
+
+# Seconds between runs of the lifespan task, 0 turns it off; whichever worker gets there first runs it
+USER_RECONCILE_INTERVAL = float(os.getenv("USER_RECONCILE_INTERVAL", "0"))
+USER_RECONCILE_BATCH_SIZE = int(os.getenv("USER_RECONCILE_BATCH_SIZE", "500"))
+# Users changed up to this many seconds before the watermark are applied again, covering
+# changes Cognito lists late
+USER_RECONCILE_OVERLAP = float(os.getenv("USER_RECONCILE_OVERLAP", "300"))
+
+WATERMARK = "cognito_users"
+# Users created in Cognito directly never set a password here; no password verifies against "!"
+COGNITO_PASSWORD_PLACEHOLDER = "!"
+
+
+@dataclass(frozen=True)
+class DirectoryUser:
+    username: str
+    email: str | None
+    enabled: bool
+    # Naive UTC, like the timestamp columns
+    last_modified: datetime
+
+
+class UserDirectory(Protocol):
+    """Where users are reconciled from."""
+
+    def pages(self) -> AsyncIterator[list[DirectoryUser]]:
+        """Yields every user of the directory, a page at a time."""
+
+
+def naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(UTC).replace(tzinfo=None)
+
+
+class CognitoUserDirectory:
+    """Pages through the user pool with ListUsers, which has no filter on modification time."""
+
+    def __init__(self, cognito: AsyncAWSCognito, page_size: int = 60):
+        self.cognito = cognito
+        self.page_size = page_size
+
+    async def pages(self):
+        pagination_token = None
+        while True:
+            response = await self.cognito.list_users(pagination_token, self.page_size)
+            yield [self.to_directory_user(user) for user in response["Users"]]
+            pagination_token = response.get("PaginationToken")
+            if not pagination_token:
+                return
+
+    @staticmethod
+    def to_directory_user(user: dict) -> DirectoryUser:
+        attributes = {attribute["Name"]: attribute["Value"] for attribute in user.get("Attributes", [])}
+        return DirectoryUser(
+            username=user["Username"],
+            email=attributes.get("email"),
+            enabled=user.get("Enabled", True),
+            last_modified=naive_utc(user["UserLastModifiedDate"]),
+        )
+
+
+class StaticUserDirectory:
+    """Fixed list of users served in pages, a local stand-in for Cognito."""
+
+    def __init__(self, users: list[DirectoryUser], page_size: int = 60):
+        self.users = users
+        self.page_size = page_size
+
+    @classmethod
+    def from_file(cls, path: str, page_size: int = 60):
+        """Loads a JSON list of {"username", "email", "enabled", "last_modified"} objects.
+
+        Only username is required; last_modified is an ISO 8601 timestamp and defaults to now.
+        """
+        with open(path) as f:
+            users = [
+                DirectoryUser(
+                    username=user["username"],
+                    email=user.get("email"),
+                    enabled=user.get("enabled", True),
+                    last_modified=naive_utc(datetime.fromisoformat(user["last_modified"]))
+                    if "last_modified" in user
+                    else utcnow(),
+                )
+                for user in json.load(f)
+            ]
+        return cls(users, page_size)
+
+    async def pages(self):
+        for start in range(0, len(self.users), self.page_size):
+            yield self.users[start : start + self.page_size]
+
+
+@dataclass
+class ReconcileResult:
+    seen: int = 0
+    upserted: int = 0
+    disabled: int = 0
+
+
+class UserReconciler:
+    """Applies the users of a UserDirectory to the user table.
+
+    Users changed since the stored watermark are upserted by username in batches, creating
+    the ones missing locally and syncing email and enabled state. Enabled local users the
+    directory no longer lists are disabled, except those whose Cognito sign up is still in
+    the outbox. The watermark row is locked for the whole run, so runs never overlap.
+    """
+
+    def __init__(
+        self,
+        directory: UserDirectory,
+        batch_size: int = USER_RECONCILE_BATCH_SIZE,
+        overlap: float = USER_RECONCILE_OVERLAP,
+    ):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.overlap = overlap
+
+    async def run_periodically(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                result = await self.run(min_interval=interval)
+            except Exception as e:
+                logger.warning(f"Unable to reconcile users with Cognito: {e}")
+            else:
+                if result is not None:
+                    logger.info(f"Reconciled users with Cognito: {result}")
+
+    async def run(self, full: bool = False, min_interval: float = 0) -> ReconcileResult | None:
+        """Reconciles once; `full` compares every listed user instead of those changed since the watermark.
+
+        Returns None when another run holds the watermark or one finished in the last `min_interval` seconds.
+        """
+        start = time.perf_counter()
+        started_at = utcnow()
+        async with session_scope() as lock_session:
+            watermark = await self._claim(lock_session, started_at - timedelta(seconds=min_interval))
+            if watermark is None:
+                return None
+
+            since = None
+            if not full and watermark.last_modified is not None:
+                since = watermark.last_modified - timedelta(seconds=self.overlap)
+
+            result = ReconcileResult()
+            seen = set()
+            changed = []
+            last_modified = watermark.last_modified
+            async with session_scope() as session:
+                async for page in self.directory.pages():
+                    for user in page:
+                        result.seen += 1
+                        seen.add(user.username)
+                        if last_modified is None or user.last_modified > last_modified:
+                            last_modified = user.last_modified
+                        if since is None or user.last_modified > since:
+                            changed.append(user)
+                    while len(changed) >= self.batch_size:
+                        result.upserted += await self._upsert(session, changed[: self.batch_size])
+                        del changed[: self.batch_size]
+                if changed:
+                    result.upserted += await self._upsert(session, changed)
+
+                # An empty listing is far more likely a misconfigured pool than everyone leaving
+                if seen:
+                    result.disabled = await self._disable_missing(session, seen, started_at)
+
+            watermark.last_modified = last_modified
+            watermark.synced_at = utcnow()
+            lock_session.add(watermark)
+            await lock_session.commit()
+
+        USER_RECONCILE_LATENCY.observe(time.perf_counter() - start)
+        return result
+
+    async def _claim(self, session, synced_before: datetime) -> SyncWatermark | None:
+        await session.execute(insert(SyncWatermark).values(name=WATERMARK).on_conflict_do_nothing())
+        await session.commit()
+        return (
+            await session.exec(
+                select(SyncWatermark)
+                .where(SyncWatermark.name == WATERMARK)
+                .where(or_(SyncWatermark.synced_at.is_(None), SyncWatermark.synced_at <= synced_before))
+                .with_for_update(skip_locked=True)
+            )
+        ).first()
+
+    async def _upsert(self, session, users: list[DirectoryUser]) -> int:
+        statement = insert(User).values(
+            [
+                {
+                    "username": user.username,
+                    "email": user.email,
+                    "password": COGNITO_PASSWORD_PLACEHOLDER,
+                    "disabled": not user.enabled,
+                }
+                for user in users
+            ]
+        )
+        excluded = statement.excluded
+        statement = statement.on_conflict_do_update(
+            index_elements=[User.username],
+            # A user without an email in Cognito keeps the local one
+            set_={"email": func.coalesce(excluded.email, User.email), "disabled": excluded.disabled},
+            # Unchanged rows aren't rewritten, so they don't fire the user_changed trigger either
+            where=or_(
+                User.email.is_distinct_from(func.coalesce(excluded.email, User.email)),
+                User.disabled.is_distinct_from(excluded.disabled),
+            ),
+        ).returning(User.username)
+
+        usernames = (await session.execute(statement)).scalars().all()
+        await session.commit()
+        self._changed("upserted", usernames)
+        return len(usernames)
+
+    async def _disable_missing(self, session, seen: set[str], started_at: datetime) -> int:
+        # Sign ups still queued, or sent after the listing began, aren't in the listing yet
+        queued = select(CognitoOutbox.username).where(CognitoOutbox.operation == SIGN_UP).where(
+            or_(CognitoOutbox.status == PENDING, CognitoOutbox.created_at >= started_at)
+        )
+        statement = select(User.username).where(User.disabled == false()).where(User.username.not_in(queued))
+
+        missing = []
+        async for partition in stream_partitions(statement, self.batch_size):
+            missing.extend(username for (username,) in partition if username not in seen)
+
+        disabled = 0
+        for start in range(0, len(missing), self.batch_size):
+            usernames = (
+                await session.execute(
+                    update(User)
+                    .where(User.username.in_(missing[start : start + self.batch_size]))
+                    .where(User.disabled == false())
+                    .values(disabled=True)
+                    .returning(User.username)
+                    .execution_options(synchronize_session=False)
+                )
+            ).scalars().all()
+            await session.commit()
+            self._changed("disabled", usernames)
+            disabled += len(usernames)
+        return disabled
+
+    @staticmethod
+    def _changed(action: str, usernames):
+        # Other workers drop their copies through the user_changed notification (USER_CACHE_LISTEN)
+        for username in usernames:
+            user_cache.delete(username)
+        USER_RECONCILE_CHANGES.labels(action).inc(len(usernames))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Reconciles the user table with the Cognito user pool")
+    parser.add_argument("--full", action="store_true", help="compare every user, ignoring the watermark")
+    parser.add_argument("--directory-file", help="JSON list of users to reconcile with instead of Cognito")
+    args = parser.parse_args()
+
+    cognito = None
+    if args.directory_file:
+        directory = StaticUserDirectory.from_file(args.directory_file)
+    else:
+        cognito = get_async_aws_cognito()
+        directory = CognitoUserDirectory(cognito)
+
+    try:
+        result = await UserReconciler(directory).run(full=args.full)
+    finally:
+        if cognito is not None:
+            cognito.executor.shutdown()
+        if async_engine is not None:
+            await async_engine.dispose()
+
+    if result is None:
+        logger.info("Another reconciliation is running, nothing to do")
+    else:
+        logger.info(f"Reconciled users with Cognito: {result}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -8,5 +8,11 @@ set -o pipefail
 echo "Running migrations..."
 alembic upgrade head
 
+# Workers write metrics here so /metrics can aggregate all of them; stale files from a previous run would be summed in
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus_multiproc}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
 echo "Starting application..."
-fastapi run --workers 4 app/main.py
\ No newline at end of file
+# WEB_CONCURRENCY is also read by app/models.py to split DB_MAX_CONNECTIONS between the worker pools
+fastapi run --workers "${WEB_CONCURRENCY:-4}" app/main.py
\ No newline at end of file
@@ -0,0 +1,88 @@
+import os
+
+from dotenv import load_dotenv
+
+# The app reads its settings when imported; values from .env win over these placeholders,
+# which only let the modules import where no database or user pool is configured
+load_dotenv()
+for name, value in {
+    "RDS_USERNAME": "postgres",
+    "RDS_PASSWORD": "postgres",
+    "RDS_HOSTNAME": "localhost",
+    "RDS_PORT": "5432",
+    "RDS_DB_NAME": "postgres",
+    "AWS_REGION": "eu-west-2",
+    "AWS_USER_POOL_ID": "test-pool",
+    "AWS_COGNITO_APP_CLIENT_ID": "test-client",
+    "AWS_COGNITO_APP_CLIENT_SECRET": "test-secret",
+    "SECRET_KEY": "test-secret-key",
+}.items():
+    os.environ.setdefault(name, value)
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+from sqlmodel import delete  # noqa: E402
+
+from app.dependencies import get_current_active_user  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models import (  # noqa: E402
+    RandomItem,
+    RandomItemSummary,
+    RandomItemVersion,
+    User,
+    UserSnapshot,
+    async_engine,
+    check_database,
+    session_scope,
+)
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    # One event loop for the whole run, the pooled asyncpg connections belong to it
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+async def database(anyio_backend):
+    """The database in RDS_*, migrated to head; tests using it are skipped when it is unreachable."""
+    try:
+        await check_database()
+    except Exception as e:
+        pytest.skip(f"database unavailable: {e}")
+
+    from alembic import command, config
+
+    command.upgrade(config.Config(os.path.join(os.path.dirname(__file__), "..", "alembic.ini")), "head")
+    yield
+    if async_engine is not None:
+        await async_engine.dispose()
+
+
+@pytest.fixture
+async def user(database):
+    """A user of its own, removed with its items afterwards, that every request is authenticated as."""
+    async with session_scope() as session:
+        db_user = User(username=f"test-{os.urandom(6).hex()}", email="test@example.com", password="!")
+        session.add(db_user)
+        await session.commit()
+        await session.refresh(db_user)
+        snapshot = UserSnapshot.model_validate(db_user)
+
+    app.dependency_overrides[get_current_active_user] = lambda: snapshot
+    yield snapshot
+    app.dependency_overrides.pop(get_current_active_user, None)
+
+    async with session_scope() as session:
+        # In this order, deleting the items updates the summary and version rows through triggers
+        for model in (RandomItem, RandomItemSummary, RandomItemVersion):
+            await session.execute(delete(model).where(model.user_id == snapshot.id))
+        await session.execute(delete(User).where(User.id == snapshot.id))
+        await session.commit()
+
+
+@pytest.fixture
+async def client(anyio_backend):
+    # ASGITransport doesn't run the lifespan, so no Cognito client, JWKS fetch or background task
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
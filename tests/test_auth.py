@@ -0,0 +1,75 @@
+import os
+import time
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+
+from app.core import aws_cognito
+from app.core.aws_cognito import AWS_COGNITO_APP_CLIENT_ID, AWSCognito
+from app.core.jwks import JWKSKeyStore
+from app.dependencies import get_aws_cognito
+from app.main import app
+
+pytestmark = pytest.mark.anyio
+
+KID = "test-kid"
+
+
+@pytest.fixture(scope="module")
+def private_key() -> bytes:
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+
+
+@pytest.fixture(autouse=True)
+def cognito(private_key, monkeypatch):
+    """A user pool whose key set holds the public half of `private_key`, under KID."""
+    public_key = jwk.construct(private_key, algorithm="RS256").public_key().to_dict()
+    store = JWKSKeyStore("https://example.com/jwks.json")
+    monkeypatch.setattr(store, "fetch_jwks", lambda: {"keys": [{**public_key, "kid": KID}]})
+    monkeypatch.setattr(aws_cognito, "jwks_store", store)
+    app.dependency_overrides[get_aws_cognito] = lambda: AWSCognito(client=object())
+    yield
+    app.dependency_overrides.pop(get_aws_cognito, None)
+
+
+def token(private_key: bytes, kid: str = KID, **claims) -> str:
+    claims = {"username": "ann", "scope": "me", "aud": AWS_COGNITO_APP_CLIENT_ID, "exp": time.time() + 60, **claims}
+    return jwt.encode(claims, private_key, algorithm="RS256", headers={"kid": kid})
+
+
+async def me(client, bearer: str):
+    return await client.get("/users/me", headers={"Authorization": f"Bearer {bearer}"})
+
+
+async def test_valid_token_is_accepted(client, database, private_key):
+    # Accepted, so the user it names is looked up; there is none by this name
+    response = await me(client, token(private_key, username=f"test-{os.urandom(6).hex()}"))
+
+    assert response.status_code == 404
+
+
+async def test_malformed_token_is_401(client):
+    response = await me(client, "garbage")
+
+    assert response.status_code == 401
+    assert response.headers["WWW-Authenticate"] == "Bearer scope=me"
+
+
+async def test_expired_token_is_401(client, private_key):
+    assert (await me(client, token(private_key, exp=time.time() - 1))).status_code == 401
+
+
+async def test_token_for_another_client_is_401(client, private_key):
+    assert (await me(client, token(private_key, aud="another-client"))).status_code == 401
+
+
+@pytest.mark.parametrize("headers", [{"kid": "unknown-kid"}, {}])
+async def test_token_signed_with_an_unknown_key_is_401(client, private_key, headers):
+    bearer = jwt.encode({"username": "ann", "aud": AWS_COGNITO_APP_CLIENT_ID}, private_key, algorithm="RS256", headers=headers)
+
+    assert (await me(client, bearer)).status_code == 401
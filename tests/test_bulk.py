@@ -0,0 +1,72 @@
+import pytest
+
+from app.routers import randoms
+
+pytestmark = pytest.mark.anyio
+
+
+async def create_items(client, count: int, min_value: int = 0, max_value: int = 0) -> list[int]:
+    response = await client.post(
+        "/randoms/batch", json={"count": count, "min_value": min_value, "max_value": max_value}
+    )
+    assert response.status_code == 200
+    return [item["id"] for item in response.json()]
+
+
+async def item_count(client) -> int:
+    return len((await client.get("/randoms/")).json())
+
+
+async def test_delete_by_ids_in_the_query(client, user):
+    ids = await create_items(client, 3)
+    response = await client.delete("/randoms/bulk", params={"ids": ids[:2]})
+
+    assert response.status_code == 200
+    assert response.json() == {"affected": 2}
+    assert await item_count(client) == 1
+
+
+async def test_delete_by_num_range_in_the_query(client, user):
+    await create_items(client, 2, 5, 5)
+    await create_items(client, 3, 50, 50)
+    response = await client.delete("/randoms/bulk", params={"min_num": 10, "max_num": 100})
+
+    assert response.json() == {"affected": 3}
+    assert await item_count(client) == 2
+
+
+async def test_delete_without_a_selection_is_422(client, user):
+    assert (await client.delete("/randoms/bulk")).status_code == 422
+
+
+async def test_reroll_within_new_bounds(client, user):
+    ids = await create_items(client, 3)
+    response = await client.patch(
+        "/randoms/bulk", json={"ids": ids, "min_value": -(2**31), "max_value": 2**31 - 1}
+    )
+
+    assert response.json() == {"affected": 3}
+
+
+OUT_OF_RANGE_SELECTIONS = [{"min_num": -(10**12)}, {"max_num": 2**31}, {"ids": [2**31]}]
+
+
+@pytest.mark.parametrize(
+    "selection", [*OUT_OF_RANGE_SELECTIONS, {"ids": [1], "min_value": 0, "max_value": 2**31}]
+)
+async def test_reroll_outside_the_integer_columns_is_422(client, user, selection):
+    assert (await client.patch("/randoms/bulk", json=selection)).status_code == 422
+
+
+@pytest.mark.parametrize("selection", OUT_OF_RANGE_SELECTIONS)
+async def test_delete_outside_the_integer_columns_is_422(client, user, selection):
+    assert (await client.delete("/randoms/bulk", params=selection)).status_code == 422
+
+
+async def test_num_range_matching_more_than_the_limit_is_refused(client, user, monkeypatch):
+    monkeypatch.setattr(randoms, "RANDOMS_MAX_BULK_SIZE", 2)
+    await create_items(client, 3)
+
+    assert (await client.patch("/randoms/bulk", json={"min_num": 0})).status_code == 422
+    assert (await client.delete("/randoms/bulk", params={"min_num": 0})).status_code == 422
+    assert await item_count(client) == 3
@@ -0,0 +1,77 @@
+import pytest
+
+from app.core.cache import SQLiteCacheBackend, UserScopedCache
+
+pytestmark = pytest.mark.anyio
+
+
+class Loader:
+    """Returns `value` and counts how often it was asked to."""
+
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        return self.value
+
+
+async def test_value_is_loaded_once_per_user_and_key():
+    cache = UserScopedCache("test", ttl=60)
+    load = Loader({"items": [1]})
+
+    assert await cache.get_or_load(1, "page", load) == {"items": [1]}
+    assert await cache.get_or_load(1, "page", load) == {"items": [1]}
+    await cache.get_or_load(2, "page", load)
+    await cache.get_or_load(1, "other", load)
+
+    assert load.calls == 3
+
+
+async def test_invalidate_drops_every_entry_of_the_user():
+    cache = UserScopedCache("test", ttl=60)
+    load = Loader([1])
+    await cache.get_or_load(1, "a", load)
+    await cache.get_or_load(1, "b", load)
+    await cache.get_or_load(2, "a", load)
+    await cache.invalidate(1)
+    await cache.get_or_load(1, "a", load)
+    await cache.get_or_load(1, "b", load)
+    await cache.get_or_load(2, "a", load)
+
+    assert load.calls == 5
+
+
+async def test_none_is_not_cached():
+    cache = UserScopedCache("test", ttl=60)
+    load = Loader(None)
+    await cache.get_or_load(1, "missing", load)
+    await cache.get_or_load(1, "missing", load)
+
+    assert load.calls == 2
+
+
+async def test_zero_ttl_disables_the_cache():
+    cache = UserScopedCache("test", ttl=0)
+    load = Loader([1])
+    await cache.get_or_load(1, "a", load)
+    await cache.get_or_load(1, "a", load)
+
+    assert not cache.enabled
+    assert load.calls == 2
+
+
+async def test_shared_tier_shares_values_and_invalidations_between_workers(tmp_path):
+    path = str(tmp_path / "cache.db")
+    worker_a = UserScopedCache("test", ttl=60, shared=SQLiteCacheBackend(path))
+    worker_b = UserScopedCache("test", ttl=60, shared=SQLiteCacheBackend(path))
+    load = Loader({"items": [1]})
+
+    await worker_a.get_or_load(1, "page", load)
+    assert await worker_b.get_or_load(1, "page", load) == {"items": [1]}
+    assert load.calls == 1
+
+    await worker_a.invalidate(1)
+    await worker_b.get_or_load(1, "page", load)
+    assert load.calls == 2
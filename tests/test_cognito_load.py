@@ -0,0 +1,64 @@
+import asyncio
+import statistics
+import time
+
+import pytest
+
+from app.core.aws_cognito import AsyncAWSCognito
+from app.core.executors import BoundedExecutor
+from app.dependencies import get_async_aws_cognito
+from app.main import app
+
+pytestmark = pytest.mark.anyio
+
+COGNITO_LATENCY = 0.25
+LOGINS = 32
+READS = 100
+
+
+class SlowCognito:
+    """Answers sign ins after COGNITO_LATENCY, blocking its thread as a boto3 call does."""
+
+    def user_signin(self, data):
+        time.sleep(COGNITO_LATENCY)
+        return {"AuthenticationResult": {"AccessToken": f"access-{data.username}", "RefreshToken": "refresh"}}
+
+
+@pytest.fixture
+def cognito():
+    executor = BoundedExecutor("cognito", max_workers=8, max_pending=LOGINS)
+    app.dependency_overrides[get_async_aws_cognito] = lambda: AsyncAWSCognito(SlowCognito(), executor)
+    yield
+    app.dependency_overrides.pop(get_async_aws_cognito, None)
+    executor.shutdown()
+
+
+def p99(latencies: list[float]) -> float:
+    return statistics.quantiles(latencies, n=100)[98]
+
+
+async def read_latencies(client, until: asyncio.Future | None = None) -> list[float]:
+    """Latencies of READS reads, or of as many as fit before `until` is done."""
+    latencies = []
+    while len(latencies) < READS if until is None else not until.done():
+        start = time.perf_counter()
+        assert (await client.get("/randoms/")).status_code == 200
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def test_slow_cognito_logins_leave_reads_p99_unchanged(client, user, cognito):
+    await client.post("/randoms/batch", json={"count": 20, "min_value": 0, "max_value": 100})
+    quiet = p99(await read_latencies(client))
+
+    logins = asyncio.gather(
+        *(client.post("/users/login", data={"username": f"user-{i}", "password": "pw"}) for i in range(LOGINS))
+    )
+    during = await read_latencies(client, until=logins)
+
+    responses = logins.result()
+    assert [response.status_code for response in responses] == [200] * LOGINS
+    assert responses[0].json()["access_token"] == "access-user-0"
+    assert len(during) >= READS
+    # A sign in on the event loop would hold reads up for COGNITO_LATENCY each
+    assert p99(during) < quiet + COGNITO_LATENCY / 5, (quiet, p99(during))
@@ -0,0 +1,43 @@
+from app.core.etags import (
+    if_match_digests,
+    item_etag,
+    list_etag,
+    none_match,
+    parse_etags,
+)
+
+ITEM = {"id": 1, "min_value": 0, "max_value": 10, "num": 7}
+
+
+def test_item_etag_is_a_strong_tag_of_the_public_fields():
+    etag = item_etag(ITEM)
+
+    assert etag.startswith('"') and etag.endswith('"')
+    assert etag == item_etag(dict(ITEM))
+    assert etag != item_etag({**ITEM, "num": 8})
+
+
+def test_list_etag_changes_with_the_version():
+    assert list_etag(1, 2) == '"1-2"'
+    assert list_etag(1, 2) != list_etag(1, 3)
+
+
+def test_parse_etags_keeps_weak_prefixes():
+    assert parse_etags(' "a", W/"b" ,,') == ['"a"', 'W/"b"']
+
+
+def test_none_match():
+    etag = item_etag(ITEM)
+
+    assert not none_match(None, etag)
+    assert none_match(etag, etag)
+    assert none_match("*", etag)
+    # If-None-Match uses the weak comparison
+    assert none_match(f'"other", W/{etag}', etag)
+    assert not none_match('"other"', etag)
+
+
+def test_if_match_digests():
+    assert if_match_digests("*") is None
+    # If-Match uses the strong comparison, weak tags never match
+    assert if_match_digests('"a", W/"b", "c"') == ["a", "c"]
@@ -0,0 +1,125 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.core.idempotency import IdempotencyMiddleware, InMemoryIdempotencyStore
+
+pytestmark = pytest.mark.anyio
+
+
+class CountingApp:
+    """Answers every request with its body and call number, or with `status` when set."""
+
+    def __init__(self):
+        self.calls = 0
+        self.status = 201
+        self.gate: asyncio.Event | None = None
+
+    async def __call__(self, scope, receive, send):
+        self.calls += 1
+        call = self.calls
+        message = await receive()
+        if self.gate is not None:
+            await self.gate.wait()
+        body = json.dumps({"call": call, "body": message["body"].decode()}).encode()
+        await send(
+            {"type": "http.response.start", "status": self.status, "headers": [(b"content-type", b"application/json")]}
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+@pytest.fixture
+def inner():
+    return CountingApp()
+
+
+@pytest.fixture
+async def client(inner):
+    middleware = IdempotencyMiddleware(inner, InMemoryIdempotencyStore(), paths={"/items"}, wait_timeout=0.5)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=middleware), base_url="http://test") as client:
+        yield client
+
+
+def post(client, body: str = "a", key: str | None = "key", **headers):
+    if key is not None:
+        headers["Idempotency-Key"] = key
+    return client.post("/items", content=body, headers=headers)
+
+
+async def test_retry_replays_the_first_response(client, inner):
+    first = await post(client)
+    retry = await post(client)
+
+    assert retry.status_code == first.status_code == 201
+    assert retry.json() == first.json() == {"call": 1, "body": "a"}
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert inner.calls == 1
+
+
+async def test_requests_without_a_key_or_to_other_paths_pass_through(client, inner):
+    await post(client, key=None)
+    await post(client, key=None)
+    await client.post("/other", content="a", headers={"Idempotency-Key": "key"})
+    await client.post("/other", content="a", headers={"Idempotency-Key": "key"})
+
+    assert inner.calls == 4
+
+
+async def test_reusing_a_key_for_another_request_is_rejected(client, inner):
+    await post(client, body="a")
+    response = await post(client, body="b")
+
+    assert response.status_code == 422
+    assert inner.calls == 1
+
+
+async def test_keys_are_scoped_to_the_authorization_header(client, inner):
+    await post(client, Authorization="Bearer ann")
+    response = await post(client, Authorization="Bearer bob")
+
+    assert response.json() == {"call": 2, "body": "a"}
+    assert inner.calls == 2
+
+
+async def test_server_errors_release_the_key(client, inner):
+    inner.status = 503
+    assert (await post(client)).status_code == 503
+    inner.status = 201
+    response = await post(client)
+
+    assert response.status_code == 201
+    assert "idempotent-replayed" not in response.headers
+    assert inner.calls == 2
+
+
+async def test_invalid_key_is_rejected(client, inner):
+    response = await post(client, key="k" * 256)
+
+    assert response.status_code == 400
+    assert inner.calls == 0
+
+
+async def test_duplicate_waits_for_the_request_in_flight(client, inner):
+    inner.gate = asyncio.Event()
+    first = asyncio.create_task(post(client))
+    await asyncio.sleep(0.05)
+    duplicate = asyncio.create_task(post(client))
+    await asyncio.sleep(0.05)
+    inner.gate.set()
+
+    assert (await first).json() == (await duplicate).json()
+    assert (await duplicate).headers["idempotent-replayed"] == "true"
+    assert inner.calls == 1
+
+
+async def test_duplicate_gives_up_with_409_after_the_wait_timeout(client, inner):
+    inner.gate = asyncio.Event()
+    first = asyncio.create_task(post(client))
+    await asyncio.sleep(0.05)
+    duplicate = await post(client)
+    inner.gate.set()
+
+    assert duplicate.status_code == 409
+    assert (await first).status_code == 201
@@ -0,0 +1,108 @@
+import asyncio
+import os
+import time
+
+import pytest
+from sqlmodel import delete, select
+
+from app.core.idempotency import StoredResponse
+from app.models import IdempotencyKey, session_scope
+from app.services.idempotency import DatabaseIdempotencyStore
+
+pytestmark = pytest.mark.anyio
+
+RESPONSE = StoredResponse(201, [(b"content-type", b"application/json"), (b"location", b"/randoms/1")], b'{"id":1}')
+
+
+@pytest.fixture
+async def keys(database):
+    """Makes keys of this test, removed afterwards."""
+    made = []
+
+    def make() -> str:
+        made.append(os.urandom(16).hex())
+        return made[-1]
+
+    yield make
+    async with session_scope() as session:
+        await session.execute(delete(IdempotencyKey).where(IdempotencyKey.key.in_(made)))
+        await session.commit()
+
+
+@pytest.fixture
+def store():
+    return DatabaseIdempotencyStore(ttl=3600, lease=60, poll_interval=0.01)
+
+
+async def stored_keys(keys: list[str]) -> set[str]:
+    async with session_scope() as session:
+        return set((await session.exec(select(IdempotencyKey.key).where(IdempotencyKey.key.in_(keys)))).all())
+
+
+async def test_first_reserve_claims_and_duplicates_get_the_running_record(store, keys):
+    key = keys()
+
+    assert await store.reserve(key, "fingerprint") is None
+    record = await store.reserve(key, "other")
+    assert record.fingerprint == "fingerprint"
+    assert record.response is None
+    assert 0 < record.expires_at - time.monotonic() <= store.lease
+
+
+async def test_only_one_of_concurrent_reserves_claims(store, keys):
+    key = keys()
+    records = await asyncio.gather(*(store.reserve(key, "fingerprint") for _ in range(5)))
+
+    assert records.count(None) == 1
+
+
+async def test_key_past_its_lease_is_taken_over(keys):
+    key = keys()
+    # A zero lease stands for a holder that died: its key is expired straight away
+    assert await DatabaseIdempotencyStore(lease=0).reserve(key, "dead") is None
+
+    store = DatabaseIdempotencyStore(lease=60)
+    assert await store.wait(key, timeout=1)
+    assert await store.reserve(key, "retry") is None
+    assert (await store.reserve(key, "duplicate")).fingerprint == "retry"
+
+
+async def test_completed_key_replays_its_response(store, keys):
+    key = keys()
+    await store.reserve(key, "fingerprint")
+    assert not await store.wait(key, timeout=0.05)
+    await store.complete(key, RESPONSE)
+
+    assert await store.wait(key, timeout=0)
+    record = await store.reserve(key, "fingerprint")
+    assert record.response == RESPONSE
+    assert store.lease < record.expires_at - time.monotonic() <= store.ttl
+
+
+async def test_released_key_can_be_claimed_again(store, keys):
+    key = keys()
+    await store.reserve(key, "fingerprint")
+    await store.release(key)
+
+    assert await store.wait(key, timeout=0)
+    assert await store.reserve(key, "retry") is None
+
+
+async def test_release_leaves_a_completed_key(store, keys):
+    key = keys()
+    await store.reserve(key, "fingerprint")
+    await store.complete(key, RESPONSE)
+    await store.release(key)
+
+    assert (await store.reserve(key, "fingerprint")).response == RESPONSE
+
+
+async def test_purge_drops_expired_keys_only(store, keys):
+    expired = [keys(), keys()]
+    for key in expired:
+        await DatabaseIdempotencyStore(lease=0).reserve(key, "fingerprint")
+    live = keys()
+    await store.reserve(live, "fingerprint")
+
+    assert await store.purge() >= len(expired)
+    assert await stored_keys([*expired, live]) == {live}
@@ -0,0 +1,83 @@
+import httpx
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk
+
+from app.core.jwks import JWKSKeyStore
+
+
+def public_jwk(kid: str) -> dict:
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return {**jwk.construct(pem, algorithm="RS256").to_dict(), "kid": kid}
+
+
+class FakeKeyStore(JWKSKeyStore):
+    """Serves `key_set` instead of fetching it, counting fetches."""
+
+    def __init__(self, key_set: list[dict], **kwargs):
+        super().__init__("https://example.com/jwks.json", **kwargs)
+        self.key_set = key_set
+        self.fetches = 0
+        self.error = None
+
+    def fetch_jwks(self) -> dict:
+        self.fetches += 1
+        if self.error is not None:
+            raise self.error
+        return {"keys": self.key_set}
+
+
+@pytest.fixture(scope="module")
+def keys() -> dict:
+    return {kid: public_jwk(kid) for kid in ("one", "two")}
+
+
+def test_prefetch_loads_every_key(keys):
+    store = FakeKeyStore(list(keys.values()))
+    store.prefetch()
+
+    assert store.has_key("one") and store.has_key("two")
+    assert store.get_key("one") is not None
+    assert store.fetches == 1
+
+
+def test_known_kid_is_served_without_fetching(keys):
+    store = FakeKeyStore([keys["one"]])
+    store.prefetch()
+    for _ in range(3):
+        store.get_key("one")
+
+    assert store.fetches == 1
+
+
+def test_unknown_kid_fetches_once_and_picks_up_rotated_keys(keys):
+    store = FakeKeyStore([keys["one"]], min_refetch_interval=0)
+    store.prefetch()
+    store.key_set = [keys["one"], keys["two"]]
+
+    assert store.get_key("two") is not None
+    assert store.fetches == 2
+
+
+def test_unknown_kids_are_refetched_at_most_once_per_interval(keys):
+    store = FakeKeyStore([keys["one"]], min_refetch_interval=60)
+    store.prefetch()
+
+    assert store.get_key("made-up") is None
+    assert store.get_key("also-made-up") is None
+    assert store.fetches == 1
+    assert not store.has_key("made-up")
+
+
+def test_failed_fetch_keeps_serving_cached_keys(keys):
+    store = FakeKeyStore([keys["one"]], min_refetch_interval=0)
+    store.prefetch()
+    store.error = httpx.ConnectError("down")
+
+    assert store.get_key("two") is None
+    assert store.get_key("one") is not None
+    assert store.fetches == 2
@@ -0,0 +1,171 @@
+import os
+from datetime import timedelta
+
+import pytest
+from botocore.exceptions import ClientError
+from sqlmodel import delete, select, update
+
+from app.core.aws_cognito import UserSignup
+from app.models import CognitoOutbox, User, session_scope, utcnow
+from app.services.outbox import DONE, FAILED, PENDING, OutboxDispatcher, signup_message
+
+pytestmark = pytest.mark.anyio
+
+
+def client_error(code: str) -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": code}}, "SignUp")
+
+
+class FakeCognito:
+    """Keeps signed up usernames, raising `errors[username]` instead when set."""
+
+    def __init__(self):
+        self.accounts = set()
+        self.errors = {}
+        self.calls = 0
+
+    async def user_signup(self, user: UserSignup):
+        self.calls += 1
+        if user.username in self.errors:
+            raise self.errors[user.username]
+        if user.username in self.accounts:
+            raise client_error("UsernameExistsException")
+        self.accounts.add(user.username)
+
+    async def resend_confirmation_code(self, username: str):
+        self.calls += 1
+
+
+@pytest.fixture
+async def outbox(database):
+    # The dispatcher claims every pending message, so these tests need the table to themselves
+    async with session_scope() as session:
+        await session.execute(delete(CognitoOutbox))
+        await session.commit()
+    usernames = []
+    yield usernames
+    async with session_scope() as session:
+        await session.execute(delete(CognitoOutbox))
+        await session.execute(delete(User).where(User.username.in_(usernames)))
+        await session.commit()
+
+
+@pytest.fixture
+def cognito():
+    return FakeCognito()
+
+
+@pytest.fixture
+def dispatcher(cognito):
+    return OutboxDispatcher(cognito, backoff=60, max_attempts=3, lease=60)
+
+
+async def queue_signup(outbox: list) -> str:
+    """Adds a local user and its sign up message, as POST /users/signup does."""
+    username = f"test-{os.urandom(6).hex()}"
+    outbox.append(username)
+    async with session_scope() as session:
+        session.add(User(username=username, email="test@example.com", password="!"))
+        session.add(signup_message(UserSignup(username=username, email="test@example.com", password="Pw-12345")))
+        await session.commit()
+    return username
+
+
+async def state(username: str):
+    async with session_scope() as session:
+        message = (await session.exec(select(CognitoOutbox).where(CognitoOutbox.username == username))).one()
+        user = (await session.exec(select(User.id).where(User.username == username))).first()
+        return message, user
+
+
+async def expire_lease(username: str):
+    async with session_scope() as session:
+        await session.execute(
+            update(CognitoOutbox)
+            .where(CognitoOutbox.username == username)
+            .values(next_attempt_at=utcnow() - timedelta(seconds=1))
+        )
+        await session.commit()
+
+
+async def test_sent_message_is_done(outbox, cognito, dispatcher):
+    username = await queue_signup(outbox)
+
+    assert await dispatcher.dispatch_batch() == 1
+    message, user = await state(username)
+    assert (message.status, message.attempts, message.payload) == (DONE, 1, None)
+    assert user is not None
+    assert username in cognito.accounts
+
+
+async def test_retryable_error_is_retried_after_a_backoff(outbox, cognito, dispatcher):
+    username = await queue_signup(outbox)
+    cognito.errors[username] = client_error("TooManyRequestsException")
+    await dispatcher.dispatch_batch()
+
+    message, user = await state(username)
+    assert (message.status, message.attempts) == (PENDING, 1)
+    assert message.next_attempt_at > utcnow() + timedelta(seconds=20)
+    assert message.payload is not None and user is not None
+    # Not claimable again until the backoff is over
+    assert await dispatcher.dispatch_batch() == 0
+
+    del cognito.errors[username]
+    await expire_lease(username)
+    await dispatcher.dispatch_batch()
+    message, _ = await state(username)
+    assert (message.status, message.attempts) == (DONE, 2)
+
+
+async def test_rejected_sign_up_fails_and_deletes_the_local_user(outbox, cognito, dispatcher):
+    username = await queue_signup(outbox)
+    cognito.errors[username] = client_error("InvalidPasswordException")
+    await dispatcher.dispatch_batch()
+
+    message, user = await state(username)
+    assert (message.status, message.attempts, message.payload) == (FAILED, 1, None)
+    assert "InvalidPasswordException" in message.last_error
+    assert user is None
+
+
+async def test_sign_up_out_of_attempts_fails(outbox, cognito, dispatcher):
+    username = await queue_signup(outbox)
+    cognito.errors[username] = client_error("TooManyRequestsException")
+    for _ in range(dispatcher.max_attempts):
+        await dispatcher.dispatch_batch()
+        await expire_lease(username)
+
+    message, user = await state(username)
+    assert (message.status, message.attempts) == (FAILED, dispatcher.max_attempts)
+    assert user is None
+
+
+async def test_message_reclaimed_after_its_worker_died_keeps_the_user(outbox, cognito, dispatcher):
+    username = await queue_signup(outbox)
+    # The worker claims the message and Cognito takes the sign up, then the worker dies
+    # before recording it
+    [claimed] = await dispatcher._claim()
+    await dispatcher._dispatch(claimed)
+    assert await dispatcher.dispatch_batch() == 0
+
+    await expire_lease(username)
+    await dispatcher.dispatch_batch()
+    message, user = await state(username)
+    assert (message.status, message.attempts) == (DONE, 2)
+    assert user is not None
+    assert cognito.calls == 2
+
+
+async def test_purge_deletes_settled_messages_past_retention(outbox, dispatcher):
+    settled = await queue_signup(outbox)
+    await dispatcher.dispatch_batch()
+    pending = await queue_signup(outbox)
+    async with session_scope() as session:
+        await session.execute(update(CognitoOutbox).values(created_at=utcnow() - timedelta(days=30)))
+        await session.commit()
+
+    assert await OutboxDispatcher(dispatcher.cognito, retention=86400).purge() == 1
+    async with session_scope() as session:
+        usernames = (await session.exec(select(CognitoOutbox.username))).all()
+    assert usernames == [pending]
+    assert settled not in usernames
@@ -0,0 +1,30 @@
+import base64
+
+import pytest
+
+from app.core.pagination import decode_cursor, encode_cursor
+
+
+@pytest.mark.parametrize("last_id", [0, 1, 42, 2**31, 2**63 - 1])
+def test_cursor_round_trips(last_id):
+    cursor = encode_cursor(last_id)
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == last_id
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "",
+        "not a cursor",
+        base64.urlsafe_b64encode(b"[1]").decode(),
+        base64.urlsafe_b64encode(b'{"offset": 1}').decode(),
+        base64.urlsafe_b64encode(b'{"id": "1"}').decode(),
+        base64.urlsafe_b64encode(b'{"id": 1.5}').decode(),
+        base64.urlsafe_b64encode(b'{"id": null}').decode(),
+    ],
+)
+def test_invalid_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError, match="invalid cursor"):
+        decode_cursor(cursor)
@@ -0,0 +1,90 @@
+import time
+
+import numpy as np
+import pytest
+
+from app.routers import playground
+
+pytestmark = pytest.mark.anyio
+
+# Numbers per second a single worker must at least serve, several times below what a laptop does;
+# text formats spend most of it turning numbers into digits
+THROUGHPUT_COUNT = 2_000_000
+THROUGHPUT_FLOORS = {"json": 2_000_000, "ndjson": 2_000_000, "binary": 10_000_000}
+
+
+async def test_default_is_one_number_between_0_and_100(client):
+    response = await client.get("/random")
+
+    assert response.status_code == 200
+    numbers = response.json()
+    assert len(numbers) == 1 and 0 <= numbers[0] <= 100
+
+
+async def test_numbers_are_within_the_inclusive_range(client):
+    numbers = (await client.get("/random", params={"min": -3, "max": 3, "count": 1000})).json()
+
+    assert len(numbers) == 1000
+    assert min(numbers) == -3 and max(numbers) == 3
+
+
+async def test_same_seed_draws_the_same_numbers(client):
+    params = {"count": 50, "seed": 7}
+    first = (await client.get("/random", params=params)).json()
+
+    assert (await client.get("/random", params=params)).json() == first
+    assert (await client.get("/random", params={**params, "seed": 8})).json() != first
+
+
+async def test_min_greater_than_max_is_400(client):
+    response = await client.get("/random", params={"min": 10, "max": 1})
+
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("params", [{"count": 0}, {"count": playground.RANDOM_MAX_COUNT + 1}, {"seed": -1}])
+async def test_out_of_bounds_parameters_are_422(client, params):
+    assert (await client.get("/random", params=params)).status_code == 422
+
+
+async def test_formats_encode_the_same_numbers(client):
+    params = {"count": 20, "seed": 1}
+    numbers = (await client.get("/random", params=params)).json()
+    ndjson = await client.get("/random", params={**params, "format": "ndjson"})
+    binary = await client.get("/random", params={**params, "format": "binary"})
+
+    assert ndjson.headers["content-type"] == "application/x-ndjson"
+    assert [int(line) for line in ndjson.text.splitlines()] == numbers
+    assert binary.headers["content-type"] == "application/octet-stream"
+    assert np.frombuffer(binary.content, dtype="<i8").tolist() == numbers
+
+
+@pytest.mark.parametrize("output_format", ["json", "ndjson", "binary"])
+async def test_counts_above_a_chunk_are_streamed_in_chunks(client, monkeypatch, output_format):
+    monkeypatch.setattr(playground, "RANDOM_CHUNK_SIZE", 16)
+    params = {"count": 100, "seed": 3, "format": output_format}
+    response = await client.get("/random", params=params)
+
+    if output_format == "json":
+        numbers = response.json()
+    elif output_format == "ndjson":
+        numbers = [int(line) for line in response.text.splitlines()]
+    else:
+        numbers = np.frombuffer(response.content, dtype="<i8").tolist()
+    assert len(numbers) == 100
+    assert numbers == np.random.default_rng(3).integers(0, 100, size=100, endpoint=True).tolist()
+
+
+@pytest.mark.parametrize("output_format", THROUGHPUT_FLOORS)
+async def test_throughput_per_worker_above_floor(client, output_format):
+    params = {"count": THROUGHPUT_COUNT, "format": output_format}
+    start = time.perf_counter()
+    response = await client.get("/random", params=params)
+    numbers_per_second = THROUGHPUT_COUNT / (time.perf_counter() - start)
+
+    assert response.status_code == 200
+    if output_format == "binary":
+        assert len(response.content) == THROUGHPUT_COUNT * 8
+    else:
+        assert response.content.count(b"\n" if output_format == "ndjson" else b",") >= THROUGHPUT_COUNT - 1
+    assert numbers_per_second > THROUGHPUT_FLOORS[output_format], numbers_per_second
@@ -0,0 +1,73 @@
+"""Each single item write is one statement; a regression here means an extra round trip per request."""
+
+import pytest
+from sqlalchemy import event
+
+from app.models import async_engine, engine
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def statements():
+    """SQL of every statement sent to the database from now on."""
+    recorded = []
+
+    def record(_conn, _cursor, statement, *_):
+        recorded.append(statement)
+
+    target = engine if async_engine is None else async_engine.sync_engine
+    event.listen(target, "before_cursor_execute", record)
+    yield recorded
+    event.remove(target, "before_cursor_execute", record)
+
+
+async def create_item(client) -> dict:
+    response = await client.post("/randoms/", json={"min_value": 1, "max_value": 10})
+    assert response.status_code == 200
+    return response.json()
+
+
+async def test_create_random_runs_one_statement(client, user, statements):
+    statements.clear()
+    item = await create_item(client)
+
+    assert 1 <= item["num"] <= 10
+    assert len(statements) == 1, statements
+
+
+async def test_update_random_runs_one_statement(client, user, statements):
+    item = await create_item(client)
+    statements.clear()
+    response = await client.patch(f"/randoms/{item['id']}", json={"min_value": 20, "max_value": 30})
+
+    assert response.status_code == 200
+    assert 20 <= response.json()["num"] <= 30
+    assert len(statements) == 1, statements
+
+
+async def test_update_random_with_if_match_runs_one_statement(client, user, statements):
+    item = await create_item(client)
+    etag = (await client.get(f"/randoms/{item['id']}")).headers["ETag"]
+    statements.clear()
+    response = await client.patch(
+        f"/randoms/{item['id']}", json={"min_value": 20, "max_value": 30}, headers={"If-Match": etag}
+    )
+
+    assert response.status_code == 200
+    assert len(statements) == 1, statements
+
+
+async def test_delete_random_runs_one_statement(client, user, statements):
+    item = await create_item(client)
+    statements.clear()
+    response = await client.delete(f"/randoms/{item['id']}")
+
+    assert response.status_code == 200
+    assert len(statements) == 1, statements
+
+
+async def test_delete_missing_random_is_404(client, user):
+    response = await client.delete("/randoms/0")
+
+    assert response.status_code == 404
@@ -0,0 +1,60 @@
+import time
+
+import pytest
+
+from app.models import RANDOMS_MAX_BATCH_SIZE
+
+pytestmark = pytest.mark.anyio
+
+BENCHMARK_ITEMS = 200
+
+
+async def test_batch_of_ranges_creates_one_item_per_range(client, user):
+    ranges = [{"min_value": i, "max_value": i + 5} for i in range(10)]
+    response = await client.post("/randoms/batch", json=ranges)
+
+    assert response.status_code == 200
+    items = response.json()
+    assert [(item["min_value"], item["max_value"]) for item in items] == [
+        (r["min_value"], r["max_value"]) for r in ranges
+    ]
+    assert all(item["min_value"] <= item["num"] <= item["max_value"] for item in items)
+    assert len({item["id"] for item in items}) == 10
+
+
+async def test_batch_count_creates_count_items_in_one_range(client, user):
+    response = await client.post("/randoms/batch", json={"count": 50, "min_value": -3, "max_value": 3})
+
+    items = response.json()
+    assert len(items) == 50
+    assert {item["num"] for item in items} <= set(range(-3, 4))
+    assert len((await client.get("/randoms/")).json()) == 50
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        [],
+        [{"min_value": 5, "max_value": 1}],
+        {"count": 0, "min_value": 0, "max_value": 1},
+        {"count": RANDOMS_MAX_BATCH_SIZE + 1, "min_value": 0, "max_value": 1},
+        [{"min_value": 0, "max_value": 1}] * (RANDOMS_MAX_BATCH_SIZE + 1),
+    ],
+)
+async def test_invalid_batches_are_422(client, user, body):
+    assert (await client.post("/randoms/batch", json=body)).status_code == 422
+
+
+async def test_batch_is_much_faster_than_one_request_per_item(client, user):
+    start = time.perf_counter()
+    for _ in range(BENCHMARK_ITEMS):
+        assert (await client.post("/randoms/", json={"min_value": 0, "max_value": 100})).status_code == 200
+    per_item = time.perf_counter() - start
+
+    start = time.perf_counter()
+    response = await client.post("/randoms/batch", json={"count": BENCHMARK_ITEMS, "min_value": 0, "max_value": 100})
+    batch = time.perf_counter() - start
+
+    assert len(response.json()) == BENCHMARK_ITEMS
+    # One request, transaction and INSERT instead of BENCHMARK_ITEMS of each
+    assert batch * 10 < per_item
@@ -0,0 +1,64 @@
+"""Serialization cost of a GET /randoms/ page, with and without RANDOMS_FAST_JSON.
+
+Timed without the database or HTTP, so the difference isn't lost in their noise.
+"""
+
+import timeit
+
+import orjson
+import pytest
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+
+from app.main import app
+from app.routers import randoms
+
+PAGE = 100
+RUNS = 200
+
+ROWS = [{"id": i, "min_value": 0, "max_value": 1000, "num": i * 7 % 1001} for i in range(1, PAGE + 1)]
+
+
+def page_route():
+    return next(route for route in app.routes if route.path == "/randoms/" and "GET" in route.methods)
+
+
+async def validated_page() -> bytes:
+    """What FastAPI does with the rows when read_randoms returns them: validate, then encode."""
+    content = await serialize_response(field=page_route().response_field, response_content=ROWS)
+    return JSONResponse(content).body
+
+
+def fast_page() -> bytes:
+    return orjson.dumps(ROWS)
+
+
+@pytest.mark.anyio
+async def test_fast_json_encodes_the_same_page(anyio_backend):
+    assert orjson.loads(fast_page()) == orjson.loads(await validated_page())
+
+
+@pytest.mark.anyio
+async def test_fast_json_is_several_times_cheaper(anyio_backend):
+    start = timeit.default_timer()
+    for _ in range(RUNS):
+        await validated_page()
+    validated = timeit.default_timer() - start
+    fast = timeit.timeit(fast_page, number=RUNS)
+
+    assert fast * 5 < validated, (fast / RUNS, validated / RUNS)
+
+
+def test_fast_json_leaves_the_openapi_schema_unchanged(monkeypatch):
+    # app.openapi() caches the schema it builds
+    monkeypatch.setattr(app, "openapi_schema", None)
+    monkeypatch.setattr(randoms, "RANDOMS_FAST_JSON", False)
+    expected = app.openapi()
+
+    app.openapi_schema = None
+    monkeypatch.setattr(randoms, "RANDOMS_FAST_JSON", True)
+    schema = app.openapi()
+
+    assert schema == expected
+    page = schema["paths"]["/randoms/"]["get"]["responses"]["200"]["content"]["application/json"]["schema"]
+    assert page["items"]["$ref"].endswith("/RandomItemPublic")
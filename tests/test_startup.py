@@ -0,0 +1,60 @@
+"""Boot time benchmarks, each run in a fresh interpreter so nothing is imported yet.
+
+The budgets are several times what a laptop takes, they catch regressions such as an
+eager import of boto3 rather than measuring small changes.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+IMPORT_BUDGET = 5.0
+FIRST_REQUEST_BUDGET = 1.0
+
+SCRIPT = """
+import asyncio, json, sys, time
+
+import httpx
+
+start = time.perf_counter()
+import app.main
+imported = time.perf_counter() - start
+
+
+async def first_request():
+    transport = httpx.ASGITransport(app=app.main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        start = time.perf_counter()
+        response = await client.get("/random")
+        return response.status_code, time.perf_counter() - start
+
+
+status, latency = asyncio.run(first_request())
+print(json.dumps({"import": imported, "status": status, "first_request": latency, "boto3": "boto3" in sys.modules}))
+"""
+
+
+@pytest.fixture(scope="module")
+def boot() -> dict:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, "-c", SCRIPT], cwd=root, capture_output=True, text=True, timeout=60, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_app_imports_within_budget(boot):
+    assert boot["import"] < IMPORT_BUDGET
+
+
+def test_boto3_is_imported_lazily(boot):
+    # Only creating the Cognito client (in the lifespan) may import it
+    assert not boot["boto3"]
+
+
+def test_first_request_within_budget(boot):
+    assert boot["status"] == 200
+    assert boot["first_request"] < FIRST_REQUEST_BUDGET
@@ -0,0 +1,59 @@
+import time
+
+from app.core.token_cache import TokenCache
+
+
+def test_get_returns_what_was_put():
+    cache = TokenCache()
+    cache.put("token", {"sub": "ann"}, time.time() + 60)
+
+    assert cache.get("token") == {"sub": "ann"}
+    assert cache.get("other") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_expired_tokens_are_not_served(monkeypatch):
+    cache = TokenCache()
+    now = time.time()
+    cache.put("already-expired", {}, now - 1)
+    cache.put("token", {}, now + 60)
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+
+    assert cache.get("already-expired") is None
+    assert cache.get("token") is None
+    assert cache.stats()["expirations"] == 1
+    assert cache.stats()["size"] == 0
+
+
+def test_least_recently_used_token_is_evicted():
+    cache = TokenCache(maxsize=2)
+    expires_at = time.time() + 60
+    cache.put("a", "a", expires_at)
+    cache.put("b", "b", expires_at)
+    cache.get("a")
+    cache.put("c", "c", expires_at)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "a"
+    assert cache.get("c") == "c"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_revoked_token_is_dropped_and_never_cached_again():
+    cache = TokenCache()
+    expires_at = time.time() + 60
+    cache.put("token", "claims", expires_at)
+    cache.revoke("token")
+    cache.put("token", "claims", expires_at)
+
+    assert cache.get("token") is None
+    assert cache.is_revoked("token")
+    assert not cache.is_revoked("other")
+
+
+def test_tokens_are_stored_by_digest():
+    cache = TokenCache()
+    cache.put("secret-token", "claims", time.time() + 60)
+
+    assert "secret-token" not in cache._entries